@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import hashlib
+import importlib.util
+from rom import Rom
+from cpu import Cpu
+from cpu import PRG_START_ADDR
+from cpu import RAM_SIZE
+from cpu import OPCODE_MASK
+from cpu import ARG_NN_MASK
+from cpu import ARG_NNN_MASK
+from cpu import CLRRET_RET
+from cpu import KB_SKP_PRESSED
+from cpu import KB_SKP_NOT_PRESSED
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pychip8")
+
+# Compiled modules are only valid for the code generator that produced them
+def emulatorVersion():
+    digest = hashlib.sha256()
+    for module in (sys.modules[Cpu.__module__], sys.modules[__name__]):
+        with open(module.__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+EMULATOR_VERSION = emulatorVersion()
+
+# Addresses the CPU can continue at after interpreting the instruction at
+# addr, the calls returning to the instruction after them
+def successors(cpu, opcode, addr):
+    family = (opcode & OPCODE_MASK) >> 12
+    nn = opcode & ARG_NN_MASK
+    handler = cpu.instructionSet.opcodes[opcode]
+    if handler.func == cpu.instructionSet.illegalInstr:
+        return []
+    elif 0x0 == family and CLRRET_RET == nn:
+        return []
+    elif 0x1 == family:
+        return [opcode & ARG_NNN_MASK]
+    elif 0x2 == family:
+        return [opcode & ARG_NNN_MASK, addr + 2]
+    elif family in (0x3, 0x4):
+        return [addr + 2, addr + 4]
+    elif 0xE == family and nn in (KB_SKP_PRESSED, KB_SKP_NOT_PRESSED):
+        return [addr + 2, addr + 4]
+    return [addr + 2]
+
+# Walks the code reachable from PRG_START_ADDR the way Cpu.runBlocks does,
+# following jumps, calls and skips from the instruction ending each block.
+# Returns (start, end, lines, handlers) for every non-empty block, as
+# generated by BlockCache.blockSource from the loaded RAM.
+def findBlocks(cpu):
+    blockCache = cpu.blockCache
+    ram = cpu.ram
+    blocks = []
+    visited = set()
+    pending = [PRG_START_ADDR]
+    while pending:
+        pc = pending.pop()
+        if pc in visited or pc < PRG_START_ADDR or pc >= RAM_SIZE - 1:
+            continue
+        visited.add(pc)
+        lines, handlers, addr, end = blockCache.blockSource(pc)
+        if addr > pc:
+            blocks.append((pc, end, lines, handlers))
+        if addr < RAM_SIZE - 1:
+            opcode = (ram[addr] << 8) | ram[addr + 1]
+            pending.extend(successors(cpu, opcode, addr))
+    return sorted(blocks)
+
+# The generated module binds its blocks to a CPU's handlers with
+# bind(opcodes), which returns (start, end, block) tuples
+def generateModule(cpu, romHash):
+    blocks = findBlocks(cpu)
+    handlers = set()
+    for pc, end, lines, blockHandlers in blocks:
+        handlers.update(blockHandlers)
+
+    source = "# Compiled from ROM " + romHash + " by aot.py, do not edit\n\n"
+    source += "ROM_HASH = \"" + romHash + "\"\n"
+    source += "EMULATOR_VERSION = \"" + EMULATOR_VERSION + "\"\n\n"
+    source += "def bind(opcodes):\n"
+    for handle in sorted(handlers):
+        source += "    " + handle + " = opcodes[0x" + handle[1:] + "]\n"
+    for pc, end, lines, blockHandlers in blocks:
+        source += "\n    def block_%03X(cpu):\n" % pc
+        for line in lines:
+            source += "        " + line + "\n"
+    source += "\n    return [\n"
+    for pc, end, lines, blockHandlers in blocks:
+        source += "        (0x%03X, 0x%03X, block_%03X),\n" % (pc, end, pc)
+    source += "    ]\n"
+    return source
+
+def compiledPath(romHash, cacheDir = None):
+    if None == cacheDir:
+        cacheDir = DEFAULT_CACHE_DIR
+    return os.path.join(cacheDir, "rom_" + romHash + "_" + EMULATOR_VERSION + ".py")
+
+# Writes the module for the ROM loaded into the CPU to the cache, replacing
+# any existing one atomically so that concurrent workers never see it half
+# written
+def compileRom(cpu, romHash, cacheDir = None):
+    path = compiledPath(romHash, cacheDir)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    tmpPath = path + "." + str(os.getpid()) + ".tmp"
+    with open(tmpPath, 'w') as file:
+        file.write(generateModule(cpu, romHash))
+    os.replace(tmpPath, path)
+    return path
+
+def importModule(path):
+    spec = importlib.util.spec_from_file_location(os.path.basename(path)[:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Fills the block cache of a CPU with the ROM already loaded into it from
+# the compiled module, compiling it first if it is not cached yet. Code not
+# found by the static walk is still translated when first reached, and
+# blocks overwritten by the program are invalidated like any other.
+# Returns the number of blocks loaded.
+def loadCompiled(cpu, romHash, cacheDir = None):
+    if None == cpu.blockCache:
+        return 0
+    path = compiledPath(romHash, cacheDir)
+    if not os.path.exists(path):
+        compileRom(cpu, romHash, cacheDir)
+    module = importModule(path)
+    if romHash != module.ROM_HASH or EMULATOR_VERSION != module.EMULATOR_VERSION:
+        module = importModule(compileRom(cpu, romHash, cacheDir))
+
+    blocks = module.bind(cpu.instructionSet.opcodes)
+    for pc, addr, block in blocks:
+        cpu.blockCache.install(pc, addr, block)
+    return len(blocks)
+
+if "__main__" == __name__:
+    romPaths = []
+    cacheDir = None
+    if '-r' in sys.argv:
+        index = sys.argv.index('-r') + 1
+        while index < len(sys.argv) and not sys.argv[index].startswith('-'):
+            romPaths.append(sys.argv[index])
+            index += 1
+    if '-o' in sys.argv:
+        index = sys.argv.index('-o')
+        cacheDir = sys.argv[index + 1]
+
+    if 0 == len(romPaths):
+        print("Provide rom paths with -r and optionally a cache directory with -o Eg. python3 aot.py -r a.ch8 b.ch8")
+        raise SystemExit
+
+    for romPath in romPaths:
+        rom = Rom()
+        rom.load(romPath)
+        cpu = Cpu(None, None, True, False)
+        cpu.load(rom.romData)
+        print(romPath + " -> " + compileRom(cpu, rom.hash, cacheDir))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import json
+import multiprocessing
+from rom import Rom
+from cpu import Cpu
+from keypad import ScriptedKeypad
+from keypad import loadScript
+from aot import loadCompiled
+
+DEFAULT_NUM_CYCLES = 100000
+
+# A job is a (romPath, scriptPath, numCycles, jit, aot) tuple, scriptPath
+# may be None to run without input. With aot the block cache starts out
+# filled from the compiled ROM cache.
+def runJob(job):
+    romPath, scriptPath, numCycles, jit, aot = job
+    rom = Rom()
+    rom.load(romPath)
+
+    events = []
+    if None != scriptPath:
+        events = loadScript(scriptPath)
+
+    cpu = Cpu(None, ScriptedKeypad(events), jit, False)
+    cpu.load(rom.romData)
+    if aot:
+        loadCompiled(cpu, rom.hash)
+    cpu.runFor(numCycles)
+
+    return {
+        "rom": romPath,
+        "romHash": rom.hash,
+        "script": scriptPath,
+        "cycles": cpu.cycles,
+        "completed": cpu.cycles >= numCycles,
+        "pc": cpu.pc,
+        "I": cpu.I,
+        "sp": cpu.sp,
+        "D": cpu.D,
+        "S": cpu.S,
+        "V": list(cpu.V),
+        "stack": list(cpu.stack),
+        "vram": list(cpu.vram),
+    }
+
+def runBatch(jobs, numProcesses = None):
+    if None == numProcesses:
+        numProcesses = os.cpu_count()
+    with multiprocessing.Pool(numProcesses) as pool:
+        return pool.map(runJob, jobs)
+
+def argList(flag):
+    values = []
+    if flag in sys.argv:
+        index = sys.argv.index(flag) + 1
+        while index < len(sys.argv) and not sys.argv[index].startswith('-'):
+            values.append(sys.argv[index])
+            index += 1
+    return values
+
+if "__main__" == __name__:
+    romPaths = argList('-r')
+    scriptPaths = argList('-i')
+    numCycles = DEFAULT_NUM_CYCLES
+    numProcesses = None
+    outPath = None
+    jit = False
+    aot = False
+    if '-c' in sys.argv:
+        index = sys.argv.index('-c')
+        numCycles = int(sys.argv[index + 1])
+    if '-p' in sys.argv:
+        index = sys.argv.index('-p')
+        numProcesses = int(sys.argv[index + 1])
+    if '-o' in sys.argv:
+        index = sys.argv.index('-o')
+        outPath = sys.argv[index + 1]
+    if '-j' in sys.argv:
+        jit = True
+    if '-aot' in sys.argv:
+        jit = True
+        aot = True
+
+    if 0 == len(romPaths):
+        print("Provide rom paths with -r and optionally input scripts with -i Eg. python3 batch.py -r a.ch8 b.ch8 -i a.txt b.txt -c 100000")
+        raise SystemExit
+
+    jobs = []
+    for index in range(len(romPaths)):
+        scriptPath = None
+        if index < len(scriptPaths):
+            scriptPath = scriptPaths[index]
+        jobs.append((romPaths[index], scriptPath, numCycles, jit, aot))
+
+    results = runBatch(jobs, numProcesses)
+    if None != outPath:
+        with open(outPath, 'w') as file:
+            json.dump(results, file)
+    else:
+        json.dump(results, sys.stdout)
+        print("")
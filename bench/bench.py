@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import json
+import random
+import multiprocessing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from roms import SYNTHETIC_ROMS
+
+DEFAULT_NUM_CYCLES    = 1000000
+DEFAULT_NUM_DRAWS     = 200000
+DEFAULT_NUM_RENDERS   = 2000
+DEFAULT_TOLERANCE     = 0.1
+DEFAULT_NUM_RUNS      = 3
+
+# Metrics for which a lower value is better, all others are rates
+LOWER_IS_BETTER = ("startupTime", "peakRss")
+
+def peakRss():
+    if None == resource:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if "darwin" == sys.platform:
+        # Reported in bytes instead of kilobytes
+        rss = rss // 1024
+    return rss * 1024
+
+# Runs a ROM headless and unthrottled for numCycles instructions. Startup
+# time covers importing the emulator and building the opcode table, so it
+# is only meaningful in a fresh process.
+def benchRom(name, romData, numCycles, jit):
+    startTime = time.perf_counter()
+    from cpu import Cpu
+    from display import ArrayGpu
+    gpu = ArrayGpu()
+    cpu = Cpu(gpu, None, jit, False)
+    cpu.load(romData)
+    startupTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    cpu.runFor(numCycles)
+    runTime = time.perf_counter() - startTime
+
+    return {
+        "name": name,
+        "startupTime": startupTime,
+        "instructionsPerSec": cpu.cycles / runTime,
+        "drawsPerSec": gpu.numFrames / runTime,
+        "peakRss": peakRss(),
+    }
+
+# Calls InstructionSet.execSetVram directly, with positions covering both
+# the plain and the wrapping paths
+def benchSetVram(numDraws):
+    from cpu import Cpu
+    from cpu import FONT_ADDRESS
+    cpu = Cpu()
+    cpu.I = FONT_ADDRESS
+    execSetVram = cpu.instructionSet.execSetVram
+    rng = random.Random(0)
+    positions = [(rng.randrange(256), rng.randrange(256)) for i in range(256)]
+
+    startTime = time.perf_counter()
+    for index in range(numDraws):
+        xPos, yPos = positions[index & 0xFF]
+        execSetVram(xPos, yPos, 5, cpu)
+    runTime = time.perf_counter() - startTime
+
+    return {
+        "name": "execSetVram",
+        "drawsPerSec": numDraws / runTime,
+        "peakRss": peakRss(),
+    }
+
+# Calls Gpu.render followed by Gpu.present, like the CPU and the main loop
+# do once per frame, on a dummy video driver. Needs pygame.
+def benchGpu(numRenders):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    try:
+        from gpu import Gpu
+    except ImportError:
+        return None
+    from cpu import Cpu
+    from cpu import FONT_ADDRESS
+    from display import SCREEN_X_SIZE
+    from display import SCREEN_Y_SIZE
+    gpu = Gpu(10)
+    cpu = Cpu(gpu)
+    cpu.I = FONT_ADDRESS
+    rng = random.Random(0)
+
+    startTime = time.perf_counter()
+    for index in range(numRenders):
+        xPos = rng.randrange(SCREEN_X_SIZE)
+        yPos = rng.randrange(SCREEN_Y_SIZE)
+        cpu.instructionSet.execSetVram(xPos, yPos, 5, cpu)
+        gpu.render(cpu.vram, [(xPos, yPos, 8, 5)])
+        gpu.present()
+    runTime = time.perf_counter() - startTime
+
+    return {
+        "name": "Gpu.render",
+        "framesPerSec": numRenders / runTime,
+        "peakRss": peakRss(),
+    }
+
+# Every workload runs in a freshly spawned process, so that startup time
+# and peak RSS are its own
+def runIsolated(func, args):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(func, args)
+
+# Keeps the best rate and the lowest startup time and RSS over all runs
+def bestOf(results):
+    best = dict(results[0])
+    for result in results[1:]:
+        for metric, value in result.items():
+            if "name" == metric or None == value:
+                continue
+            if metric in LOWER_IS_BETTER:
+                best[metric] = min(best[metric], value)
+            else:
+                best[metric] = max(best[metric], value)
+    return best
+
+def runBenchmarks(romPaths, numCycles, numDraws, numRenders, jit, numRuns):
+    workloads = []
+    for name, buildRom in SYNTHETIC_ROMS.items():
+        workloads.append((benchRom, (name, buildRom(), numCycles, jit)))
+    for romPath in romPaths:
+        with open(romPath, 'rb') as file:
+            romData = file.read()
+        workloads.append((benchRom, (os.path.basename(romPath), romData, numCycles, jit)))
+    workloads.append((benchSetVram, (numDraws,)))
+    workloads.append((benchGpu, (numRenders,)))
+
+    results = {}
+    for func, args in workloads:
+        runs = [runIsolated(func, args) for i in range(numRuns)]
+        if None == runs[0]:
+            continue
+        result = bestOf(runs)
+        results[result.pop("name")] = result
+    return {
+        "python": sys.version.split()[0],
+        "jit": jit,
+        "numCycles": numCycles,
+        "results": results,
+    }
+
+# Returns (name, metric, baseline, current, change) for every metric in
+# both reports, where a negative change is a regression
+def compare(baseline, current):
+    rows = []
+    for name, result in current["results"].items():
+        baseResult = baseline["results"].get(name)
+        if None == baseResult:
+            continue
+        for metric, value in result.items():
+            baseValue = baseResult.get(metric)
+            if None == value or not baseValue:
+                continue
+            change = value / baseValue - 1.0
+            if metric in LOWER_IS_BETTER:
+                change = -change
+            rows.append((name, metric, baseValue, value, change))
+    return rows
+
+def printReport(report):
+    for name, result in report["results"].items():
+        print(name)
+        for metric, value in result.items():
+            if None != value:
+                print("    %-20s %14.6g" % (metric, value))
+
+def printComparison(rows, tolerance):
+    numRegressions = 0
+    for name, metric, baseValue, value, change in rows:
+        marker = ""
+        if change < -tolerance:
+            marker = "  REGRESSION"
+            numRegressions += 1
+        print("%-14s %-20s %14.6g %14.6g %+8.1f%%%s" %
+              (name, metric, baseValue, value, change * 100.0, marker))
+    return numRegressions
+
+def argValue(flag, default):
+    if flag in sys.argv:
+        return sys.argv[sys.argv.index(flag) + 1]
+    return default
+
+def argList(flag):
+    values = []
+    if flag in sys.argv:
+        index = sys.argv.index(flag) + 1
+        while index < len(sys.argv) and not sys.argv[index].startswith('-'):
+            values.append(sys.argv[index])
+            index += 1
+    return values
+
+if "__main__" == __name__:
+    if '-h' in sys.argv:
+        print("Eg. python3 bench/bench.py -r game.ch8 -c 1000000 -n 3 -o result.json -b baseline.json -t 0.1 -j")
+        raise SystemExit
+
+    romPaths = argList('-r')
+    numCycles = int(argValue('-c', DEFAULT_NUM_CYCLES))
+    numDraws = int(argValue('-d', DEFAULT_NUM_DRAWS))
+    numRenders = int(argValue('-f', DEFAULT_NUM_RENDERS))
+    numRuns = int(argValue('-n', DEFAULT_NUM_RUNS))
+    outPath = argValue('-o', None)
+    baselinePath = argValue('-b', None)
+    tolerance = float(argValue('-t', DEFAULT_TOLERANCE))
+    jit = '-j' in sys.argv
+
+    report = runBenchmarks(romPaths, numCycles, numDraws, numRenders, jit, numRuns)
+    if None != outPath:
+        with open(outPath, 'w') as file:
+            json.dump(report, file, indent = 2)
+    printReport(report)
+
+    if None != baselinePath:
+        with open(baselinePath, 'r') as file:
+            baseline = json.load(file)
+        print("")
+        if 0 != printComparison(compare(baseline, report), tolerance):
+            raise SystemExit(1)
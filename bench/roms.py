@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# Synthetic stress ROMs. Each one is an endless loop hammering one part of
+# the emulator, so any number of instructions can be run from it.
+
+PRG_START_ADDR = 0x200
+
+def assemble(opcodes):
+    code = bytearray()
+    for opcode in opcodes:
+        code.append(opcode >> 8)
+        code.append(opcode & 0xFF)
+    return bytes(code)
+
+# Draws font sprites all over the screen, including across the edges, so
+# that every DXYN takes the wrapping path now and then
+def drawRom():
+    return assemble([
+        0x6000, # 200: V0 = 0       x
+        0x6100, # 202: V1 = 0       y
+        0x6200, # 204: V2 = 0       digit
+        0x630F, # 206: V3 = 0xF
+        0xF229, # 208: I = font(V2)
+        0xD015, # 20A: draw V0, V1, 5
+        0x7007, # 20C: V0 += 7
+        0x7103, # 20E: V1 += 3
+        0x7201, # 210: V2 += 1
+        0x8232, # 212: V2 &= V3
+        0x1208, # 214: loop
+    ])
+
+# Register arithmetic, the bulk of what most games execute
+def arithmeticRom():
+    return assemble([
+        0x6001, # 200: V0 = 1
+        0x6103, # 202: V1 = 3
+        0x6207, # 204: V2 = 7
+        0x7013, # 206: V0 += 0x13
+        0x8014, # 208: V0 += V1
+        0x8125, # 20A: V1 -= V2
+        0x8202, # 20C: V2 &= V0
+        0x8306, # 20E: shift V3
+        0x840E, # 210: shift V4
+        0x8510, # 212: V5 = V1
+        0xC6FF, # 214: V6 = rand
+        0xF01E, # 216: I += V0
+        0xA300, # 218: I = 0x300
+        0x3000, # 21A: skip if V0 == 0
+        0x4100, # 21C: skip if V1 != 0
+        0x1206, # 21E: loop
+        0x1206, # 220: loop
+    ])
+
+# Nested subroutine calls and returns, the stack at most three deep
+def callRom():
+    return assemble([
+        0x2210, # 200: call 210
+        0x7001, # 202: V0 += 1
+        0x1200, # 204: loop
+        0x0000,
+        0x0000,
+        0x0000,
+        0x0000,
+        0x0000,
+        0x2220, # 210: call 220
+        0x7101, # 212: V1 += 1
+        0x00EE, # 214: ret
+        0x0000,
+        0x0000,
+        0x0000,
+        0x0000,
+        0x0000,
+        0x2230, # 220: call 230
+        0x00EE, # 222: ret
+        0x0000,
+        0x0000,
+        0x0000,
+        0x0000,
+        0x0000,
+        0x0000,
+        0x7201, # 230: V2 += 1
+        0x00EE, # 232: ret
+    ])
+
+SYNTHETIC_ROMS = {
+    "draw": drawRom,
+    "arithmetic": arithmeticRom,
+    "call": callRom,
+}
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import zlib
+import struct
+import shlex
+import queue
+import threading
+import subprocess
+from display import SCREEN_X_SIZE
+from display import SCREEN_Y_SIZE
+from display import unpackRow
+
+FORMAT_PNG               = "png"
+FORMAT_RAW               = "raw"
+FORMAT_PIPE              = "pipe"
+
+ROW_BYTES                = SCREEN_X_SIZE // 8
+FRAME_BYTES              = ROW_BYTES * SCREEN_Y_SIZE
+MAX_QUEUED_FRAMES        = 256
+
+# Raw captures start with a header: magic, version, width and height,
+# followed by records of a frame number and the packed frame, one bit per
+# pixel with rows stored most significant byte first
+RAW_MAGIC                = b"C8FR"
+RAW_VERSION              = 0x1
+RAW_HEADER               = struct.Struct("<4sBHH")
+RAW_FRAME                = struct.Struct("<I")
+
+PNG_SIGNATURE            = b"\x89PNG\r\n\x1a\n"
+# Unpacked pixels are 0 or 1, encoders are fed 8 bit grey levels
+GREY_LEVELS              = bytes([0x00, 0xFF]) + bytes(254)
+
+def packFrame(vram):
+    return b"".join([row.to_bytes(ROW_BYTES, 'big') for row in vram])
+
+def pngChunk(chunkType, data):
+    chunk = chunkType + data
+    return struct.pack(">I", len(data)) + chunk + struct.pack(">I", zlib.crc32(chunk))
+
+# A packed frame already is the pixel data of a 1 bit greyscale PNG, apart
+# from the filter type byte starting every row
+def encodePng(frame):
+    header = struct.pack(">IIBBBBB", SCREEN_X_SIZE, SCREEN_Y_SIZE, 1, 0, 0, 0, 0)
+    rows = b"".join([b"\x00" + frame[offset:offset + ROW_BYTES]
+                     for offset in range(0, FRAME_BYTES, ROW_BYTES)])
+    return (PNG_SIGNATURE + pngChunk(b"IHDR", header) +
+            pngChunk(b"IDAT", zlib.compress(rows)) + pngChunk(b"IEND", b""))
+
+def unpackFrame(frame):
+    pixels = b"".join([unpackRow(int.from_bytes(frame[offset:offset + ROW_BYTES], 'big'))
+                       for offset in range(0, FRAME_BYTES, ROW_BYTES)])
+    return pixels.translate(GREY_LEVELS)
+
+# Yields (frameNumber, packedFrame) for every frame of a raw capture
+def readRaw(path):
+    with open(path, 'rb') as file:
+        magic, version, width, height = RAW_HEADER.unpack(file.read(RAW_HEADER.size))
+        if RAW_MAGIC != magic or RAW_VERSION != version:
+            raise ValueError(path + " is not a version " + str(RAW_VERSION) + " capture")
+        while True:
+            record = file.read(RAW_FRAME.size + FRAME_BYTES)
+            if len(record) < RAW_FRAME.size + FRAME_BYTES:
+                return
+            yield RAW_FRAME.unpack_from(record)[0], record[RAW_FRAME.size:]
+
+# Writes captured frames on a background thread, so that the emulator never
+# waits for encoding or disk I/O. Frames identical to the previous one are
+# dropped before they are queued. A PNG capture is a directory holding one
+# file per distinct frame, named after its frame number. A raw capture is a
+# single file, see RAW_HEADER. A pipe capture feeds every frame, repeating
+# unchanged ones, to the stdin of a command as 8 bit greyscale rawvideo,
+# Eg. ffmpeg -f rawvideo -pix_fmt gray -s 64x32 -r 60 -i - out.mp4
+class FrameCapture(object):
+    def __init__(self, path, captureFormat = FORMAT_PNG):
+        self.path = path
+        self.format = captureFormat
+        self.lastFrame = None
+        self.lastNumber = None
+        self.latestNumber = None
+        self.numFrames = 0
+        self.numDropped = 0
+        self.frames = queue.Queue(MAX_QUEUED_FRAMES)
+        self.file = None
+        self.process = None
+        if FORMAT_PNG == self.format:
+            os.makedirs(self.path, exist_ok = True)
+        elif FORMAT_RAW == self.format:
+            self.file = open(self.path, 'wb')
+            self.file.write(RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, SCREEN_X_SIZE, SCREEN_Y_SIZE))
+        elif FORMAT_PIPE == self.format:
+            self.process = subprocess.Popen(shlex.split(self.path), stdin = subprocess.PIPE)
+        else:
+            raise ValueError("Unknown capture format " + str(captureFormat))
+        # A daemon, so that an error before close() does not keep the
+        # process alive waiting for more frames
+        self.thread = threading.Thread(target = self.writeFrames, daemon = True)
+        self.thread.start()
+
+    # Called by the producer once per frame. When the writer falls so far
+    # behind that the queue is full, the frame is dropped rather than
+    # stalling the emulator.
+    def capture(self, vram, frameNumber):
+        self.latestNumber = frameNumber
+        frame = packFrame(vram)
+        if frame == self.lastFrame:
+            return
+        try:
+            self.frames.put_nowait((frameNumber, frame))
+            self.lastFrame = frame
+            self.lastNumber = frameNumber
+        except queue.Full:
+            self.numDropped += 1
+
+    def writeFrames(self):
+        lastNumber = None
+        lastFrame = None
+        while True:
+            item = self.frames.get()
+            if None == item:
+                return
+            frameNumber, frame = item
+            if FORMAT_PNG == self.format:
+                fileName = os.path.join(self.path, "frame_%06d.png" % frameNumber)
+                with open(fileName, 'wb') as file:
+                    file.write(encodePng(frame))
+            elif FORMAT_RAW == self.format:
+                self.file.write(RAW_FRAME.pack(frameNumber) + frame)
+            else:
+                pixels = unpackFrame(frame)
+                if None != lastNumber:
+                    for repeat in range(frameNumber - lastNumber - 1):
+                        self.process.stdin.write(lastFrame)
+                self.process.stdin.write(pixels)
+                lastFrame = pixels
+            lastNumber = frameNumber
+            self.numFrames += 1
+
+    # Waits for every queued frame to be written. A pipe is also fed the
+    # repeats of the last frame up to the last captured frame number.
+    def close(self):
+        if FORMAT_PIPE == self.format and self.latestNumber != self.lastNumber:
+            self.frames.put((self.latestNumber, self.lastFrame))
+        self.frames.put(None)
+        self.thread.join()
+        if None != self.file:
+            self.file.close()
+        if None != self.process:
+            self.process.stdin.close()
+            self.process.wait()
+
+# Runs a ROM headless and captures the screen at the end of every frame,
+# so that the same ROM and input always give the same capture
+def captureRom(romPath, outPath, captureFormat, numFrames, scriptPath = None, seed = None):
+    from rom import Rom
+    from cpu import Cpu
+    from keypad import ScriptedKeypad
+    from keypad import loadScript
+    rom = Rom()
+    rom.load(romPath)
+    events = []
+    if None != scriptPath:
+        events = loadScript(scriptPath)
+    cpu = Cpu(None, ScriptedKeypad(events), False, False)
+    if None != seed:
+        cpu.rng.seed(seed)
+    cpu.load(rom.romData)
+
+    capture = FrameCapture(outPath, captureFormat)
+    try:
+        for frameNumber in range(numFrames):
+            cpu.runFor(cpu.timerPeriod)
+            capture.capture(cpu.vram, frameNumber)
+            if not cpu.running:
+                break
+    finally:
+        capture.close()
+    print("Captured " + str(capture.numFrames) + " distinct frames to " + outPath)
+
+def argValue(flag, default = None):
+    if flag in sys.argv:
+        index = sys.argv.index(flag)
+        return sys.argv[index + 1]
+    return default
+
+if "__main__" == __name__:
+    romPath = argValue('-r')
+    outPath = argValue('-o')
+    if None == romPath or None == outPath:
+        print("Usage: python3 capture.py -r <rom> -o <dir|file|command> [-f png|raw|pipe] [-c frames] [-i script] [-seed seed]")
+        raise SystemExit
+    seed = argValue('-seed')
+    if None != seed:
+        seed = int(seed)
+    captureRom(romPath, outPath, argValue('-f', FORMAT_PNG), int(argValue('-c', 600)), argValue('-i'), seed)
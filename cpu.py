@@ -1,53 +1,61 @@
 #!/usr/bin/env python3
 
+import sys
 import threading
 import time
 import random
-from gpu import SCREEN_X_SIZE
-from gpu import SCREEN_Y_SIZE
-from keyboard import Keyboard
+import functools
+import struct
+import collections
+import array
+from display import SCREEN_X_SIZE
+from display import SCREEN_Y_SIZE
+from display import NullGpu
+from display import FULL_SCREEN
+from display import wrapSpans
+from keypad import NullKeypad
+from keypad import NO_MORE_INPUT
 
 U8_MAX                   = 0xFF
 U16_MAX                  = 0xFFFF
 
 RAM_SIZE                 = 4096
-VRAM_SIZE                = SCREEN_X_SIZE * SCREEN_Y_SIZE
+VRAM_SIZE                = SCREEN_Y_SIZE # One packed row per scanline
+ROW_MASK                 = (1 << SCREEN_X_SIZE) - 1
 STACK_SIZE               = 16
 
 NUM_REGISTERS            = 0x10
 
 NUM_INSTRUCTIONS         = 0x10
-NUM_0x8_INSTRUCTIONS     = 0x9
-NUM_MISC_INSTRUCTIONS    = 0x9
+NUM_OPCODES              = 0x10000
+CLRRET_RET               = 0xEE
+CLRRET_CLRSCRN           = 0xE0
+KB_SKP_PRESSED           = 0x9E
+KB_SKP_NOT_PRESSED       = 0xA1
 MISC_BCD                 = 0x33
-MISC_BCD_INDEX           = 0x0
 MISC_SET_SPRT_ADDR       = 0x29
-MISC_SET_SPRT_ADDR_INDEX = 0x1
 MISC_REG_LOAD            = 0x65
-MISC_REG_LOAD_INDEX      = 0x2
 MISC_SET_DLY_TIMER       = 0x15
-MISC_SET_DLY_TIMER_INDEX = 0x3
 MISC_GET_DLY_TIMER       = 0x7
-MISC_GET_DLY_TIMER_INDEX = 0x4
 MISC_SET_SND_TIMER       = 0x18
-MISC_SET_SND_TIMER_INDEX = 0x5
 MISC_WAIT_KEY            = 0x0A
-MISC_WAIT_KEY_INDEX      = 0x6
 MISC_ADI                 = 0x1E
-MISC_ADI_INDEX           = 0x7
 MISC_STR_REG             = 0x55
-MISC_STR_REG_INDEX       = 0x8
-
-NUM_CRLRET_INSTRUCTINS   = 0x2
-CLRRET_RET               = 0xEE
-CLRRET_RET_INDEX         = 0x0
-CLRRET_CLRSCRN           = 0xE0
-CLRRET_CLRSCRN_INDEX     = 0x1
 PRG_START_ADDR           = 0x200
 
-OPCODE_MASK              = 0xF0
-ARG_HIGH_MASK            = 0x0F
-ARG_LOW_MASK             = 0xF0
+OPCODE_MASK              = 0xF000
+ARG_X_MASK               = 0x0F00
+ARG_Y_MASK               = 0x00F0
+ARG_N_MASK               = 0x000F
+ARG_NN_MASK              = 0x00FF
+ARG_NNN_MASK             = 0x0FFF
+
+OPERANDS_NONE            = 0x0
+OPERANDS_X               = 0x1
+OPERANDS_XY              = 0x2
+OPERANDS_XNN             = 0x3
+OPERANDS_NNN             = 0x4
+OPERANDS_XYN             = 0x5
 
 SPRITE_WIDTH             = 0x8
 
@@ -60,6 +68,32 @@ SIG_STACK_UNDERFLOW      = 0x3
 DELAY_CYCLE_PERIOD       = 60 # Hz
 MS_IN_SEC                = 1000 # ms
 RUN_FREQ_IN_HZ           = 500 #Hz
+DELAY_CYCLE_LENGTH       = int((MS_IN_SEC / DELAY_CYCLE_PERIOD) / (MS_IN_SEC / RUN_FREQ_IN_HZ) + 1)
+FRAME_TIME               = 1.0 / DELAY_CYCLE_PERIOD # s
+MAX_FRAMES_BEHIND        = 4
+
+MAX_BLOCK_SIZE           = 64 # instructions
+MAX_IDLE_LOOP_SIZE       = 8 # instructions
+
+# Instructions an idle loop may consist of
+LOOP_JUMP                = 0x0
+LOOP_SKP_EQ              = 0x1
+LOOP_SKP_NOT_EQ          = 0x2
+LOOP_LD_REG              = 0x3
+LOOP_SKP_KEY             = 0x4
+LOOP_SKP_NOT_KEY         = 0x5
+LOOP_GET_DLY_TIMER       = 0x6
+
+STATE_VERSION            = 0x1
+RNG_STATE_SIZE           = 625
+NO_INTERRUPT             = -1
+
+# Save state layout: version, RAM, VRAM rows, V, I, PC, SP, stack, D, S,
+# delay cycle, cycle count, pending interrupt, RNG version, RNG state,
+# whether a gauss value is pending and the pending gauss value
+STATE_LAYOUT = struct.Struct("<B" + str(RAM_SIZE) + "s" + str(VRAM_SIZE) + "Q" +
+                             str(NUM_REGISTERS) + "sIHB" + str(STACK_SIZE) + "H" +
+                             "BBHQbB" + str(RNG_STATE_SIZE) + "I?d")
 
 FONT_ADDRESS             = 0x50
 FONT_SPRITE_SIZE         = 0x5
@@ -82,64 +116,137 @@ FONT_SPRITES = [
     0xF0, 0x80, 0xF0, 0x80, 0x80,  # F
 ]
 
+def decodeOperands(opcode, operands):
+    x = (opcode & ARG_X_MASK) >> 8
+    y = (opcode & ARG_Y_MASK) >> 4
+    if OPERANDS_X == operands:
+        return (x,)
+    elif OPERANDS_XY == operands:
+        return (x, y)
+    elif OPERANDS_XNN == operands:
+        return (x, opcode & ARG_NN_MASK)
+    elif OPERANDS_NNN == operands:
+        return (opcode & ARG_NNN_MASK,)
+    elif OPERANDS_XYN == operands:
+        return (x, y, opcode & ARG_N_MASK)
+    return ()
+
 class Instruction(object):
-    def __init__(self, func, numSubInstructions = 0, illInstr = None):
+    __slots__ = ("handle", "operands", "subMask", "subInstructions")
+
+    def __init__(self, func, operands = OPERANDS_NONE, subMask = None):
         self.handle = func
-        self.subInstructions = []
-        for i in range(numSubInstructions):
-            self.subInstructions.append(Instruction(illInstr))
+        self.operands = operands
+        self.subMask = subMask
+        self.subInstructions = {}
+
+    def decode(self, opcode, illInstr):
+        instruction = self
+        if None != self.subMask:
+            instruction = self.subInstructions.get(opcode & self.subMask, illInstr)
+        operands = decodeOperands(opcode, instruction.operands)
+        return functools.partial(instruction.handle, *operands)
 
 class InstructionSet(object):
+    __slots__ = ("illInstr", "instructions", "opcodes", "idleLoops")
+
     def __init__(self):
-        self.instructions = [None] * NUM_INSTRUCTIONS
-        for i in range(NUM_INSTRUCTIONS):
-            self.instructions[i] = Instruction(self.illegalInstr)
-
-        self.instructions[0x0] = Instruction(self.execClrRet, NUM_CRLRET_INSTRUCTINS, self.illegalInstr)
-        self.instructions[0x0].subInstructions[CLRRET_RET_INDEX] = Instruction(self.execRet)
-        self.instructions[0x0].subInstructions[CLRRET_CLRSCRN_INDEX] = Instruction(self.execClrScrn)
-        self.instructions[0x1] = Instruction(self.execJump)
-        self.instructions[0x2] = Instruction(self.execCall)
-        self.instructions[0x3] = Instruction(self.execSkpInstrIfEqVX)
-        self.instructions[0x4] = Instruction(self.execSkpInstrIfNotEqVX)
-        self.instructions[0x6] = Instruction(self.execLdReg)
-        self.instructions[0x7] = Instruction(self.execAddX)
-        self.instructions[0x8] = Instruction(self.exec8XY, NUM_0x8_INSTRUCTIONS, self.illegalInstr)
-        self.instructions[0x8].subInstructions[0x0] = Instruction(self.execAssignXY)
-        self.instructions[0x8].subInstructions[0x2] = Instruction(self.execAndXY)
-        self.instructions[0x8].subInstructions[0x4] = Instruction(self.execAddXY)
-        self.instructions[0x8].subInstructions[0x5] = Instruction(self.execSubXY)
-        self.instructions[0x8].subInstructions[0x6] = Instruction(self.execShL)
-        self.instructions[0xA] = Instruction(self.execSetI)
-        self.instructions[0xC] = Instruction(self.execRandVX)
-        self.instructions[0xD] = Instruction(self.execRendering)
-        self.instructions[0xE] = Instruction(self.execKbRoutine)
-        self.instructions[0xF] = Instruction(self.execMiscInstructions, NUM_MISC_INSTRUCTIONS, self.illegalInstr)
-        self.instructions[0xF].subInstructions[MISC_BCD_INDEX] = Instruction(self.execBCD)
-        self.instructions[0xF].subInstructions[MISC_SET_SPRT_ADDR_INDEX] = Instruction(self.execSetSprtAddress)
-        self.instructions[0xF].subInstructions[MISC_REG_LOAD_INDEX] = Instruction(self.execRegLoad)
-        self.instructions[0xF].subInstructions[MISC_SET_DLY_TIMER_INDEX] = Instruction(self.execSetDlyTmr)
-        self.instructions[0xF].subInstructions[MISC_GET_DLY_TIMER_INDEX] = Instruction(self.execGetDlyTmr)
-        self.instructions[0xF].subInstructions[MISC_SET_SND_TIMER_INDEX] = Instruction(self.execSetSndTmr)
-        self.instructions[0xF].subInstructions[MISC_WAIT_KEY_INDEX] = Instruction(self.execKbRoutine)
-        self.instructions[0xF].subInstructions[MISC_ADI_INDEX] = Instruction(self.execAdi)
-        self.instructions[0xF].subInstructions[MISC_STR_REG_INDEX] = Instruction(self.execStrReg)
-
-    def getAddress(self, cpu):
-        return ((cpu.ram[cpu.pc] & ARG_HIGH_MASK) << 8) | cpu.ram[cpu.pc + 1]
+        self.illInstr = Instruction(self.illegalInstr)
+        self.instructions = [self.illInstr] * NUM_INSTRUCTIONS
+
+        self.instructions[0x0] = Instruction(None, OPERANDS_NONE, ARG_NN_MASK)
+        self.instructions[0x0].subInstructions[CLRRET_RET] = Instruction(self.execRet)
+        self.instructions[0x0].subInstructions[CLRRET_CLRSCRN] = Instruction(self.execClrScrn)
+        self.instructions[0x1] = Instruction(self.execJump, OPERANDS_NNN)
+        self.instructions[0x2] = Instruction(self.execCall, OPERANDS_NNN)
+        self.instructions[0x3] = Instruction(self.execSkpInstrIfEqVX, OPERANDS_XNN)
+        self.instructions[0x4] = Instruction(self.execSkpInstrIfNotEqVX, OPERANDS_XNN)
+        self.instructions[0x6] = Instruction(self.execLdReg, OPERANDS_XNN)
+        self.instructions[0x7] = Instruction(self.execAddX, OPERANDS_XNN)
+        self.instructions[0x8] = Instruction(None, OPERANDS_NONE, ARG_N_MASK)
+        self.instructions[0x8].subInstructions[0x0] = Instruction(self.execAssignXY, OPERANDS_XY)
+        self.instructions[0x8].subInstructions[0x2] = Instruction(self.execAndXY, OPERANDS_XY)
+        self.instructions[0x8].subInstructions[0x4] = Instruction(self.execAddXY, OPERANDS_XY)
+        self.instructions[0x8].subInstructions[0x5] = Instruction(self.execSubXY, OPERANDS_XY)
+        self.instructions[0x8].subInstructions[0x6] = Instruction(self.execShL, OPERANDS_X)
+        self.instructions[0x8].subInstructions[0xE] = Instruction(self.execShL, OPERANDS_X)
+        self.instructions[0xA] = Instruction(self.execSetI, OPERANDS_NNN)
+        self.instructions[0xC] = Instruction(self.execRandVX, OPERANDS_XNN)
+        self.instructions[0xD] = Instruction(self.execRendering, OPERANDS_XYN)
+        self.instructions[0xE] = Instruction(None, OPERANDS_NONE, ARG_NN_MASK)
+        self.instructions[0xE].subInstructions[KB_SKP_PRESSED] = Instruction(self.execSkpIfKeyPressed, OPERANDS_X)
+        self.instructions[0xE].subInstructions[KB_SKP_NOT_PRESSED] = Instruction(self.execSkpIfKeyNotPressed, OPERANDS_X)
+        self.instructions[0xF] = Instruction(None, OPERANDS_NONE, ARG_NN_MASK)
+        self.instructions[0xF].subInstructions[MISC_BCD] = Instruction(self.execBCD, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_SET_SPRT_ADDR] = Instruction(self.execSetSprtAddress, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_REG_LOAD] = Instruction(self.execRegLoad, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_SET_DLY_TIMER] = Instruction(self.execSetDlyTmr, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_GET_DLY_TIMER] = Instruction(self.execGetDlyTmr, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_SET_SND_TIMER] = Instruction(self.execSetSndTmr, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_WAIT_KEY] = Instruction(self.execWaitKey, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_ADI] = Instruction(self.execAdi, OPERANDS_X)
+        self.instructions[0xF].subInstructions[MISC_STR_REG] = Instruction(self.execStrReg, OPERANDS_X)
+
+        # Flat table mapping every 16 bit opcode to its handler with the
+        # operands already extracted, so executing an instruction is one
+        # lookup and one call
+        self.opcodes = [None] * NUM_OPCODES
+        for opcode in range(NUM_OPCODES):
+            self.opcodes[opcode] = self.decode(opcode)
+
+        # Loop code -> decoded idle loop, or None if the code is not one
+        self.idleLoops = {}
+
+    def decode(self, opcode):
+        family = (opcode & OPCODE_MASK) >> 12
+        return self.instructions[family].decode(opcode, self.illInstr)
+
+    # An idle loop is a short loop closed by a backward jump that only reads
+    # the delay timer, loads constants and tests registers and keys, such as
+    # the usual FX07 / 3X00 / 1NNN wait for the delay timer. As long as the
+    # delay timer and the keys do not change every iteration does exactly
+    # the same thing. Returns the loop as (kind, x, nn) tuples, or None.
+    def idleLoop(self, ram, start, end):
+        code = bytes(ram[start:end + 2])
+        loop = self.idleLoops.get(code, False)
+        if False != loop:
+            return loop
+
+        loop = []
+        numTimerReads = 0
+        for offset in range(0, len(code) - 2, 2):
+            opcode = (code[offset] << 8) | code[offset + 1]
+            family = (opcode & OPCODE_MASK) >> 12
+            x = (opcode & ARG_X_MASK) >> 8
+            nn = opcode & ARG_NN_MASK
+            if 0x3 == family:
+                loop.append((LOOP_SKP_EQ, x, nn))
+            elif 0x4 == family:
+                loop.append((LOOP_SKP_NOT_EQ, x, nn))
+            elif 0x6 == family:
+                loop.append((LOOP_LD_REG, x, nn))
+            elif 0xE == family and KB_SKP_PRESSED == nn:
+                loop.append((LOOP_SKP_KEY, x, nn))
+            elif 0xE == family and KB_SKP_NOT_PRESSED == nn:
+                loop.append((LOOP_SKP_NOT_KEY, x, nn))
+            elif 0xF == family and MISC_GET_DLY_TIMER == nn:
+                loop.append((LOOP_GET_DLY_TIMER, x, nn))
+                numTimerReads += 1
+            else:
+                loop = None
+                break
+        # With a single timer read an iteration sees either the old or the
+        # new timer value, never a mix of both
+        if None != loop and numTimerReads <= 1:
+            loop.append((LOOP_JUMP, 0x0, 0x0))
+        else:
+            loop = None
+        self.idleLoops[code] = loop
+        return loop
 
     def illegalInstr(self, cpu):
         cpu.interrupt = SIG_ILL_INSTR
 
-    def execClrRet(self, cpu):
-        subInstruction = cpu.ram[cpu.pc + 1]
-        if CLRRET_RET == subInstruction:
-            self.instructions[0x0].subInstructions[CLRRET_RET_INDEX].handle(cpu)
-        elif CLRRET_CLRSCRN == subInstruction:
-            self.instructions[0x0].subInstructions[CLRRET_CLRSCRN_INDEX].handle(cpu)
-        else:
-            cpu.interrupt = SIG_ILL_INSTR
-
     def execRet(self, cpu):
         retAddr = cpu.stack[cpu.sp]
         if cpu.sp > 0:
@@ -149,66 +256,52 @@ class InstructionSet(object):
             cpu.interrupt = SIG_STACK_UNDERFLOW
 
     def execClrScrn(self, cpu):
-        for byte in cpu.vram:
-            byte = 0x0
+        for yCoord in range(SCREEN_Y_SIZE):
+            cpu.vram[yCoord] = 0x0
+        cpu.damage.append(FULL_SCREEN)
         cpu.interrupt = SIG_DRAW_GRAPHICS
 
-    def execJump(self, cpu):
-        cpu.pc = self.getAddress(cpu) - 2
+    def execJump(self, addr, cpu):
+        loop = None
+        if addr <= cpu.pc and cpu.pc - addr < MAX_IDLE_LOOP_SIZE * 2:
+            if None == cpu.debugger or not cpu.debugger.activated:
+                loop = self.idleLoop(cpu.ram, addr, cpu.pc)
+        cpu.pc = addr - 2
+        if None != loop:
+            cpu.fastForwardLoop(loop)
 
-    def execCall(self, cpu):
+    def execCall(self, addr, cpu):
         if cpu.sp < STACK_SIZE:
             cpu.sp += 1
-            jumpAddress = self.getAddress(cpu)
             cpu.stack[cpu.sp] = cpu.pc
-            cpu.pc = jumpAddress - 2
+            cpu.pc = addr - 2
         else:
             cpu.interrupt = SIG_STACK_OVERFLOW
 
-    def execSkpInstrIfEqVX(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        val = cpu.ram[cpu.pc + 1]
+    def execSkpInstrIfEqVX(self, reg, val, cpu):
         if val == cpu.V[reg]:
             cpu.pc += 2
 
-    def execSkpInstrIfNotEqVX(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        val = cpu.ram[cpu.pc + 1]
+    def execSkpInstrIfNotEqVX(self, reg, val, cpu):
         if val != cpu.V[reg]:
             cpu.pc += 2
 
-    def execLdReg(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        cpu.V[reg] = cpu.ram[cpu.pc + 1]
+    def execLdReg(self, reg, val, cpu):
+        cpu.V[reg] = val
 
-    def execAddX(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        val = cpu.V[reg] + cpu.ram[cpu.pc + 1]
+    def execAddX(self, reg, val, cpu):
+        val = cpu.V[reg] + val
         if val > 255:
             val = val - 256
         cpu.V[reg] = val
 
-
-    def exec8XY(self, cpu):
-        subInstruction = (cpu.ram[cpu.pc + 1] & ARG_HIGH_MASK)
-        if subInstruction != 0xE:
-            self.instructions[0x8].subInstructions[subInstruction].handle(cpu)
-        else:
-            self.instructions[0x8].subInstructions[0x6].handle(cpu)
-
-    def execAssignXY(self, cpu):
-        regX = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        regY = (cpu.ram[cpu.pc + 1] & ARG_LOW_MASK) >> 4
+    def execAssignXY(self, regX, regY, cpu):
         cpu.V[regX] = cpu.V[regY]
 
-    def execAndXY(self, cpu):
-        regX = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        regY = (cpu.ram[cpu.pc + 1] & ARG_LOW_MASK) >> 4
+    def execAndXY(self, regX, regY, cpu):
         cpu.V[regX] = cpu.V[regX] & cpu.V[regY]
 
-    def execAddXY(self, cpu):
-        regX = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        regY = (cpu.ram[cpu.pc + 1] & ARG_LOW_MASK) >> 4
+    def execAddXY(self, regX, regY, cpu):
         val = cpu.V[regX] + cpu.V[regY]
         if val > 255:
             val -= 256
@@ -217,9 +310,7 @@ class InstructionSet(object):
             cpu.V[0xF] = 0
         cpu.V[regX] = val
 
-    def execSubXY(self, cpu):
-        regX = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        regY = (cpu.ram[cpu.pc + 1] & ARG_LOW_MASK) >> 4
+    def execSubXY(self, regX, regY, cpu):
         val = cpu.V[regX] - cpu.V[regY]
         if cpu.V[regX] < cpu.V[regY]:
             val += 256
@@ -228,137 +319,295 @@ class InstructionSet(object):
             cpu.V[0xF] = 1
         cpu.V[regX] = val
 
-    def execShL(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execShL(self, reg, cpu):
         tmpVal = (cpu.V[reg] & 0x80) >> 8
         cpu.V[0xF] = tmpVal
-        cpu.V[reg] = cpu.V[reg] << 1
+        cpu.V[reg] = (cpu.V[reg] << 1) & U8_MAX
 
-    def execSetI(self, cpu):
-        val = ((cpu.ram[cpu.pc] & ARG_HIGH_MASK) << 8) | cpu.ram[cpu.pc + 1]
+    def execSetI(self, val, cpu):
         cpu.I = val
 
-    def execRandVX(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        val = cpu.ram[cpu.pc + 1]
-        cpu.V[reg] = (val & random.randint(0, 255))
+    def execRandVX(self, reg, val, cpu):
+        cpu.V[reg] = (val & cpu.rng.randint(0, 255))
 
+    # Each VRAM row is a SCREEN_X_SIZE bit integer with the leftmost pixel
+    # in the most significant bit, so a sprite row is drawn by rotating it
+    # into place and XORing it onto the scanline
     def execSetVram(self, xStartPos, yStartPos, spriteHeight, cpu):
+        shift = SCREEN_X_SIZE - SPRITE_WIDTH - (xStartPos % SCREEN_X_SIZE)
         for yIndex in range(spriteHeight):
-            pixByte = bin(cpu.ram[cpu.I + yIndex])
-            pixByte = pixByte[2:].zfill(8)
-            yCoord = yStartPos + yIndex
-            yCoord = yCoord % SCREEN_Y_SIZE
-
-            for xIndex in range(8):
-                xCoord = xStartPos + xIndex
-                xCoord = xCoord % SCREEN_X_SIZE
-
-                pixVal = int(pixByte[xIndex])
-                # Set pixel to new pix val XOR old pix val
-                vramAddr = yCoord * SCREEN_X_SIZE + xCoord
-                oldPixVal = cpu.vram[vramAddr]
-                if pixVal == 1 and oldPixVal == 1:
-                    cpu.V[0xF] = cpu.V[0xF] | 1
-                    pixVal = 0
-                elif pixVal == 0 and oldPixVal == 1:
-                    pixVal = 1
-
-                cpu.vram[vramAddr] = pixVal
-
-    def execRendering(self, cpu):
-        regX = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        regY = (cpu.ram[cpu.pc + 1] & ARG_LOW_MASK) >> 4
+            spriteRow = cpu.ram[cpu.I + yIndex]
+            if shift >= 0:
+                pixels = spriteRow << shift
+            else:
+                # Sprite wraps around the right edge of the screen
+                pixels = ((spriteRow >> -shift) | (spriteRow << (SCREEN_X_SIZE + shift))) & ROW_MASK
+
+            yCoord = (yStartPos + yIndex) % SCREEN_Y_SIZE
+            if cpu.vram[yCoord] & pixels:
+                cpu.V[0xF] = cpu.V[0xF] | 1
+            cpu.vram[yCoord] ^= pixels
+
+    def execRendering(self, regX, regY, spriteSize, cpu):
         xPos = cpu.V[regX]
         yPos = cpu.V[regY]
-        spriteSize = (cpu.ram[cpu.pc + 1] & ARG_HIGH_MASK)
         cpu.V[0xF] = 0
         self.execSetVram(xPos, yPos, spriteSize, cpu)
+        for xStart, width in wrapSpans(xPos, SPRITE_WIDTH, SCREEN_X_SIZE):
+            for yStart, height in wrapSpans(yPos, spriteSize, SCREEN_Y_SIZE):
+                cpu.damage.append((xStart, yStart, width, height))
         cpu.interrupt = SIG_DRAW_GRAPHICS
 
-    def execKbRoutine(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
-        subRoutine = cpu.ram[cpu.pc + 1]
-
-        if 0x9E == subRoutine:
-            if True == cpu.keyboard.keyPressed(cpu.V[reg]):
-             cpu.pc += 2
-        elif 0xA1 == subRoutine:
-            if False == cpu.keyboard.keyPressed(cpu.V[reg]):
-             cpu.pc += 2
-        elif 0x0A == subRoutine:
-            key = cpu.keyboard.waitKeyPressed()
-            cpu.V[reg] = key
-        else:
-            cpu.interrupt = SIG_ILL_INSTR
-
-    def execMiscInstructions(self, cpu):
-        instruction = cpu.ram[cpu.pc + 1]
-        if MISC_BCD == instruction:
-            self.instructions[0xF].subInstructions[MISC_BCD_INDEX].handle(cpu)
-        elif MISC_SET_SPRT_ADDR == instruction:
-            self.instructions[0xF].subInstructions[MISC_SET_SPRT_ADDR_INDEX].handle(cpu)
-        elif MISC_REG_LOAD == instruction:
-            self.instructions[0xF].subInstructions[MISC_REG_LOAD_INDEX].handle(cpu)
-        elif MISC_SET_DLY_TIMER == instruction:
-            self.instructions[0xF].subInstructions[MISC_SET_DLY_TIMER_INDEX].handle(cpu)
-        elif MISC_GET_DLY_TIMER == instruction:
-            self.instructions[0xF].subInstructions[MISC_GET_DLY_TIMER_INDEX].handle(cpu)
-        elif MISC_SET_SND_TIMER == instruction:
-            self.instructions[0xF].subInstructions[MISC_SET_SND_TIMER_INDEX].handle(cpu)
-        elif MISC_WAIT_KEY == instruction:
-            self.instructions[0xF].subInstructions[MISC_WAIT_KEY_INDEX].handle(cpu)
-        elif MISC_ADI == instruction:
-            self.instructions[0xF].subInstructions[MISC_ADI_INDEX].handle(cpu)
-        elif MISC_STR_REG == instruction:
-            self.instructions[0xF].subInstructions[MISC_STR_REG_INDEX].handle(cpu)
+    def execSkpIfKeyPressed(self, reg, cpu):
+        if True == cpu.keyboard.keyPressed(cpu.V[reg]):
+            cpu.pc += 2
+
+    def execSkpIfKeyNotPressed(self, reg, cpu):
+        if False == cpu.keyboard.keyPressed(cpu.V[reg]):
+            cpu.pc += 2
+
+    # Waiting for a key press is a halt state: until a key is pressed the
+    # instruction is executed again every cycle, so that timers keep running
+    # and the CPU can be stopped, with Cpu.idle skipping the cycles in which
+    # nothing can happen
+    def execWaitKey(self, reg, cpu):
+        if not cpu.waitingForKey:
+            cpu.waitingForKey = True
+            cpu.keyboard.beginWait()
+        key = cpu.keyboard.pollKeyPress()
+        if None == key:
+            cpu.pc -= 2
+            cpu.idle()
         else:
-            cpu.interrupt = SIG_ILL_INSTR
+            cpu.waitingForKey = False
+            cpu.V[reg] = key
 
-    def execBCD(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execBCD(self, reg, cpu):
         val = cpu.V[reg]
         cpu.ram[cpu.I] = int(val / 100)
         cpu.ram[cpu.I + 1] = int((val % 100) / 10)
         cpu.ram[cpu.I + 2] = int(val % 10)
+        if None != cpu.blockCache:
+            cpu.blockCache.invalidate(cpu.I, 3)
 
-    def execSetSprtAddress(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execSetSprtAddress(self, reg, cpu):
         val = cpu.V[reg]
         cpu.I = FONT_ADDRESS + val * FONT_SPRITE_SIZE
 
-    def execRegLoad(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execRegLoad(self, reg, cpu):
         for i in range(reg + 1):
             cpu.V[i] = cpu.ram[cpu.I]
             cpu.I += 1
 
-    def execSetDlyTmr(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execSetDlyTmr(self, reg, cpu):
         cpu.D = cpu.V[reg]
 
-    def execGetDlyTmr(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execGetDlyTmr(self, reg, cpu):
         cpu.V[reg] = cpu.D
 
-    def execSetSndTmr(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execSetSndTmr(self, reg, cpu):
         cpu.S = cpu.V[reg]
 
-    def execAdi(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execAdi(self, reg, cpu):
         cpu.I += cpu.V[reg]
 
-    def execStrReg(self, cpu):
-        reg = cpu.ram[cpu.pc] & ARG_HIGH_MASK
+    def execStrReg(self, reg, cpu):
         for regIndex in range(reg + 1):
             cpu.ram[cpu.I + regIndex] = cpu.V[regIndex]
+        if None != cpu.blockCache:
+            cpu.blockCache.invalidate(cpu.I, reg + 1)
+
+# Decoding the opcode table is expensive and the handlers keep no state of
+# their own, so all CPUs in a process share one instruction set
+instructionSet = None
+
+def sharedInstructionSet():
+    global instructionSet
+    if None == instructionSet:
+        instructionSet = InstructionSet()
+    return instructionSet
+
+class BlockCache(object):
+    __slots__ = ("cpu", "blocks", "owners", "stopAddresses")
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.blocks = {}
+        self.owners = {}
+        self.stopAddresses = frozenset()
+
+    # Blocks end before any of these addresses, e.g. debugger breakpoints
+    def setStopAddresses(self, addresses):
+        self.stopAddresses = frozenset(addresses)
+        self.clear()
+
+    def isBodyInstruction(self, opcode):
+        family = (opcode & OPCODE_MASK) >> 12
+        if family in (0x6, 0x7, 0xA, 0xC):
+            return True
+        elif 0x8 == family:
+            return (opcode & ARG_N_MASK) in (0x0, 0x2, 0x4, 0x5, 0x6, 0xE)
+        elif 0xF == family:
+            return (opcode & ARG_NN_MASK) in (MISC_SET_SPRT_ADDR, MISC_REG_LOAD, MISC_ADI)
+        return False
+
+    def inlineSource(self, opcode):
+        family = (opcode & OPCODE_MASK) >> 12
+        x = (opcode & ARG_X_MASK) >> 8
+        y = (opcode & ARG_Y_MASK) >> 4
+        n = opcode & ARG_N_MASK
+        nn = opcode & ARG_NN_MASK
+        if 0x6 == family:
+            return ["V[%d] = %d" % (x, nn)]
+        elif 0x7 == family:
+            return ["V[%d] = (V[%d] + %d) & 0xFF" % (x, x, nn)]
+        elif 0xA == family:
+            return ["cpu.I = %d" % (opcode & ARG_NNN_MASK)]
+        elif 0x8 == family and 0x0 == n:
+            return ["V[%d] = V[%d]" % (x, y)]
+        elif 0x8 == family and 0x2 == n:
+            return ["V[%d] = V[%d] & V[%d]" % (x, x, y)]
+        elif 0x8 == family and 0x4 == n:
+            return ["val = V[%d] + V[%d]" % (x, y),
+                    "V[0xF] = val >> 8",
+                    "V[%d] = val & 0xFF" % x]
+        elif 0x8 == family and 0x5 == n:
+            return ["val = V[%d] - V[%d]" % (x, y),
+                    "V[0xF] = 0 if val < 0 else 1",
+                    "V[%d] = val & 0xFF" % x]
+        elif 0xF == family and MISC_ADI == nn:
+            return ["cpu.I += V[%d]" % x]
+        elif 0xF == family and MISC_SET_SPRT_ADDR == nn:
+            return ["cpu.I = %d + V[%d] * %d" % (FONT_ADDRESS, x, FONT_SPRITE_SIZE)]
+        return None
+
+    # A short backward jump may close an idle loop, which execJump has to
+    # look at. It cannot when the part of the loop inside the block holds an
+    # instruction idle loops never contain, anything but a register load.
+    def mayCloseIdleLoop(self, pc, addr, target):
+        if target > addr or addr - target >= MAX_IDLE_LOOP_SIZE * 2:
+            return False
+        ram = self.cpu.ram
+        for bodyAddr in range(max(pc, target), addr, 2):
+            if 0x6 != ram[bodyAddr] >> 4:
+                return False
+        return True
+
+    # Generates the instruction at addr ending the block starting at pc, for
+    # the jumps, calls, returns and register skips, which only touch the pc,
+    # the stack and V. Returns None for instructions left to the interpreter.
+    def terminatorSource(self, opcode, pc, addr):
+        family = (opcode & OPCODE_MASK) >> 12
+        x = (opcode & ARG_X_MASK) >> 8
+        nn = opcode & ARG_NN_MASK
+        nnn = opcode & ARG_NNN_MASK
+        if 0x0 == family and CLRRET_RET == nn:
+            return ["if cpu.sp > 0:",
+                    "    cpu.pc = cpu.stack[cpu.sp] + 2",
+                    "    cpu.sp -= 1",
+                    "else:",
+                    "    cpu.interrupt = %d" % SIG_STACK_UNDERFLOW,
+                    "    cpu.pc = %d" % (addr + 2)]
+        elif 0x1 == family and not self.mayCloseIdleLoop(pc, addr, nnn):
+            return ["cpu.pc = %d" % nnn]
+        elif 0x2 == family:
+            return ["if cpu.sp < %d:" % STACK_SIZE,
+                    "    cpu.sp += 1",
+                    "    cpu.stack[cpu.sp] = %d" % addr,
+                    "    cpu.pc = %d" % nnn,
+                    "else:",
+                    "    cpu.interrupt = %d" % SIG_STACK_OVERFLOW,
+                    "    cpu.pc = %d" % (addr + 2)]
+        elif 0x3 == family:
+            return ["cpu.pc = %d if %d == V[%d] else %d" % (addr + 4, nn, x, addr + 2)]
+        elif 0x4 == family:
+            return ["cpu.pc = %d if %d != V[%d] else %d" % (addr + 4, nn, x, addr + 2)]
+        return None
+
+    # Generates the body of the block starting at pc: the straight-line run
+    # of instructions that neither touch the pc, the timers, VRAM, the
+    # keyboard nor RAM contents, then the instruction ending the block if
+    # terminatorSource can generate it, else it is left to the interpreter.
+    # The block moves the pc on and ticks the timers itself. Returns the
+    # source lines, a dict of the handlers they call by name, the address of
+    # the instruction ending the block and the address the block's code ends
+    # at, past that instruction when it is included.
+    def blockSource(self, pc):
+        ram = self.cpu.ram
+        opcodes = self.cpu.instructionSet.opcodes
+        handlers = {}
+        lines = ["V = cpu.V"]
+        addr = pc
+        while addr < RAM_SIZE - 1 and (addr - pc) < MAX_BLOCK_SIZE * 2:
+            opcode = (ram[addr] << 8) | ram[addr + 1]
+            if not self.isBodyInstruction(opcode):
+                break
+            if addr != pc and addr in self.stopAddresses:
+                break
+            source = self.inlineSource(opcode)
+            if None == source:
+                handle = "h%04X" % opcode
+                handlers[handle] = opcodes[opcode]
+                source = [handle + "(cpu)"]
+            lines.extend(source)
+            addr += 2
+
+        end = addr
+        numInstructions = (addr - pc) // 2
+        terminator = None
+        if addr > pc and addr < RAM_SIZE - 1 and addr not in self.stopAddresses:
+            terminator = self.terminatorSource((ram[addr] << 8) | ram[addr + 1], pc, addr)
+        if None != terminator:
+            lines.extend(terminator)
+            end = addr + 2
+            numInstructions += 1
+        else:
+            lines.append("cpu.pc = %d" % addr)
+        lines.append("cpu.tickTimers(%d)" % numInstructions)
+        return lines, handlers, addr, end
+
+    # Translates the block starting at pc into a single Python function, or
+    # None when the interpreter is to run the instruction at pc
+    def translate(self, pc):
+        lines, namespace, addr, end = self.blockSource(pc)
+        if addr == pc:
+            block = None
+            end = pc + 2
+        else:
+            source = "def block(cpu):\n"
+            for line in lines:
+                source += "    " + line + "\n"
+            exec(compile(source, "<block " + hex(pc) + ">", "exec"), namespace)
+            block = namespace["block"]
+        self.install(pc, end, block)
+        return block
+
+    # Adds a block covering pc up to addr, e.g. one compiled ahead of time
+    def install(self, pc, addr, block):
+        self.blocks[pc] = block
+        for ownedAddr in range(pc, addr):
+            self.owners.setdefault(ownedAddr, set()).add(pc)
+
+    def invalidate(self, addr, length):
+        for ownedAddr in range(addr, addr + length):
+            starts = self.owners.pop(ownedAddr, None)
+            if None != starts:
+                for start in starts:
+                    self.blocks.pop(start, None)
+
+    def clear(self):
+        self.blocks = {}
+        self.owners = {}
 
 class Interrupt(object):
+    __slots__ = ("handle",)
+
     def __init__(self, handle):
         self.handle = handle
 
 class Interrupts(object):
+    __slots__ = ("interrupts",)
+
     def __init__(self):
         self.interrupts = [None] * NUM_INTERRUPTS
         for i in range(NUM_INTERRUPTS):
@@ -375,7 +624,8 @@ class Interrupts(object):
         cpu.running = False
 
     def drawGraphics(self, cpu):
-        cpu.gpu.render(cpu.vram)
+        cpu.gpu.render(cpu.vram, cpu.damage)
+        cpu.damage = []
 
     def stackOverflow(self, cpu):
         print("Stack overflow at " + hex(cpu.pc - PRG_START_ADDR))
@@ -386,75 +636,454 @@ class Interrupts(object):
         cpu.running = False
 
 
-class Cpu(threading.Thread):
-    def __init__(self, gpu):
-        threading.Thread.__init__(self)
+# Machine state is kept in flat byte and word buffers so that it can be
+# copied in and out with single slice assignments
+class Cpu(object):
+    __slots__ = ("gpu", "ram", "vram", "damage", "V", "I", "D", "S", "stack",
+                 "sp", "pc", "rng", "running", "requests", "instructionSet",
+                 "debugger", "interrupt", "interruptTable", "throttled",
+                 "timerPeriod", "cycles", "delayCycle", "blockCache",
+                 "keyboard", "thread", "profiler", "tracer", "endCycle",
+                 "waitingForKey", "frameDeadline")
+
+    def __init__(self, gpu = None, keyboard = None, jit = False, throttled = True, timerPeriod = DELAY_CYCLE_LENGTH):
+        if None == gpu:
+            gpu = NullGpu()
+        if None == keyboard:
+            keyboard = NullKeypad()
         self.gpu = gpu
-        self.ram = [U8_MAX] * RAM_SIZE
-        self.vram = [0x0] * VRAM_SIZE
+        self.gpu.setCpu(self)
+        self.ram = bytearray([U8_MAX]) * RAM_SIZE
+        self.vram = array.array('Q', [0x0]) * VRAM_SIZE
+        self.damage = []
 
-        self.V = [U8_MAX] * NUM_REGISTERS
+        self.V = bytearray([U8_MAX]) * NUM_REGISTERS
         self.I = U16_MAX
         self.D = 0x0
         self.S = 0x0
 
-        self.stack = [U16_MAX] * STACK_SIZE
+        self.stack = array.array('H', [U16_MAX]) * STACK_SIZE
         self.sp = 0x0
 
         self.pc = PRG_START_ADDR
 
+        self.rng = random.Random()
+
         self.running = False
-        self.instructionSet = InstructionSet()
+        self.thread = None
+        self.requests = collections.deque()
+        self.instructionSet = sharedInstructionSet()
         self.debugger = None
+        self.profiler = None
+        self.tracer = None
         self.interrupt = None
         self.interruptTable = Interrupts()
 
+        self.throttled = throttled
+        self.timerPeriod = timerPeriod
+        self.cycles = 0
         self.delayCycle = 0
+        self.endCycle = sys.maxsize
+        self.frameDeadline = None
+        self.waitingForKey = False
+
+        self.blockCache = None
+        if True == jit:
+            self.blockCache = BlockCache(self)
 
-        self.keyboard = Keyboard()
+        self.keyboard = keyboard
+        self.keyboard.setCpu(self)
 
-        fontOffset = 0
-        for font in FONT_SPRITES:
-            self.ram[FONT_ADDRESS + fontOffset] = font
-            fontOffset += 1
+        self.ram[FONT_ADDRESS:FONT_ADDRESS + len(FONT_SPRITES)] = bytes(FONT_SPRITES)
 
     def run(self):
+        self.runFor(None)
+
+    # Runs until stopped or until numCycles more instructions have been
+    # executed. Can be called directly to run the CPU in the calling thread.
+    def runFor(self, numCycles):
+        endCycle = sys.maxsize
+        if None != numCycles:
+            endCycle = self.cycles + numCycles
+        self.endCycle = endCycle
+        self.frameDeadline = None
         self.running = True
-        while self.running:
-            self.debugger.trace()
+        if None != self.debugger and self.debugger.activated:
+            self.runDebug(endCycle)
+        elif None != self.tracer:
+            self.runTraced(endCycle)
+        elif None != self.profiler:
+            self.runProfiled(endCycle)
+        elif None != self.blockCache:
+            self.runBlocks(endCycle)
+        else:
+            self.runInstructions(endCycle)
 
+    def runInstructions(self, endCycle):
+        while self.running and self.cycles < endCycle:
             if None != self.interrupt:
                 self.interruptTable.interrupts[self.interrupt].handle(self)
                 self.interrupt = None
             else:
-                timeBefore = time.time() * 1000
-                op = (self.ram[self.pc] & OPCODE_MASK) >> 4
-                self.instructionSet.instructions[op].handle(self)
+                opcode = (self.ram[self.pc] << 8) | self.ram[self.pc + 1]
+                self.instructionSet.opcodes[opcode](self)
                 self.pc += 2
+                self.tickTimers(1)
 
-                timeAfter = time.time() * 1000
-                elapsedTime = timeAfter - timeBefore
-                if elapsedTime < (MS_IN_SEC / RUN_FREQ_IN_HZ):
-                    toSleep = ((MS_IN_SEC / RUN_FREQ_IN_HZ)) - elapsedTime
-                    toSleep = toSleep / MS_IN_SEC
-                    time.sleep(toSleep)
+    def runBlocks(self, endCycle):
+        blocks = self.blockCache.blocks
+        while self.running and self.cycles < endCycle:
+            if None != self.interrupt:
+                self.interruptTable.interrupts[self.interrupt].handle(self)
+                self.interrupt = None
+            else:
+                # Close to the end of the run single step, so that a block
+                # never executes past endCycle
+                block = None
+                if self.cycles + MAX_BLOCK_SIZE < endCycle:
+                    block = blocks.get(self.pc, False)
+                    if False == block:
+                        block = self.blockCache.translate(self.pc)
+
+                if None != block:
+                    block(self)
+                else:
+                    opcode = (self.ram[self.pc] << 8) | self.ram[self.pc + 1]
+                    self.instructionSet.opcodes[opcode](self)
+                    self.pc += 2
+                    self.tickTimers(1)
+
+    # Checks the debugger between every block, or every instruction when
+    # stepping or when not using the block cache. Blocks never extend past a
+    # breakpoint, so none is missed.
+    def runDebug(self, endCycle):
+        debugger = self.debugger
+        while self.running and self.cycles < endCycle:
+            if None != self.interrupt:
+                self.interruptTable.interrupts[self.interrupt].handle(self)
+                self.interrupt = None
+                continue
 
-                self.delayCycle = (self.delayCycle + 1) % int((MS_IN_SEC / DELAY_CYCLE_PERIOD) / (MS_IN_SEC / RUN_FREQ_IN_HZ) + 1)
-                if 0 == self.delayCycle:
-                    if self.D > 0x0:
-                        self.D -= 0x1
-                    if self.S > 0x0:
-                        self.S -= 0x1
+            # Checked right before an instruction runs, so that handling an
+            # interrupt does not hit the same address twice
+            debugger.check()
 
+            block = None
+            if None != self.blockCache and not debugger.stepping and self.cycles + MAX_BLOCK_SIZE < endCycle:
+                block = self.blockCache.blocks.get(self.pc, False)
+                if False == block:
+                    block = self.blockCache.translate(self.pc)
 
+            if None != block:
+                block(self)
+            else:
+                opcode = (self.ram[self.pc] << 8) | self.ram[self.pc + 1]
+                self.instructionSet.opcodes[opcode](self)
+                self.pc += 2
+                self.tickTimers(1)
+
+    # Interprets instructions like runInstructions, recording per
+    # instruction statistics with the profiler
+    def runProfiled(self, endCycle):
+        profiler = self.profiler
+        profiler.start()
+        while self.running and self.cycles < endCycle:
+            if None != self.interrupt:
+                self.interruptTable.interrupts[self.interrupt].handle(self)
+                self.interrupt = None
+            else:
+                pc = self.pc
+                opcode = (self.ram[pc] << 8) | self.ram[pc + 1]
+                handler = self.instructionSet.opcodes[opcode]
+                handlerStart = time.perf_counter()
+                handler(self)
+                profiler.record(pc, opcode, handler, time.perf_counter() - handlerStart)
+                self.pc += 2
+                self.tickTimers(1)
+                if 0 == self.delayCycle:
+                    profiler.endFrame()
+        profiler.stop()
+
+    # Interprets instructions like runInstructions, handing the tracer every
+    # executed instruction along with the registers from before it executed
+    def runTraced(self, endCycle):
+        tracer = self.tracer
+        tracer.begin(self)
+        while self.running and self.cycles < endCycle:
+            if None != self.interrupt:
+                self.interruptTable.interrupts[self.interrupt].handle(self)
+                self.interrupt = None
+            else:
+                pc = self.pc
+                oldV = bytes(self.V)
+                oldI = self.I
+                oldSp = self.sp
+                oldD = self.D
+                oldS = self.S
+                opcode = (self.ram[pc] << 8) | self.ram[pc + 1]
+                self.instructionSet.opcodes[opcode](self)
+                tracer.record(pc, opcode, self, oldV, oldI, oldSp, oldD, oldS)
+                self.pc += 2
+                self.tickTimers(1)
+
+    # The delay and sound timers are driven by the number of executed
+    # instructions, not by wall clock time, so they behave the same whether
+    # or not execution is throttled. A timer tick ends a frame, when
+    # throttled the CPU then sleeps until the frame is due to end.
+    def tickTimers(self, numInstructions):
+        self.cycles += numInstructions
+        self.delayCycle += numInstructions
+        if self.delayCycle >= self.timerPeriod:
+            numTicks = self.delayCycle // self.timerPeriod
+            self.delayCycle -= numTicks * self.timerPeriod
+            self.D = max(self.D - numTicks, 0x0)
+            self.S = max(self.S - numTicks, 0x0)
+            if self.requests:
+                self.serviceRequests()
+            if self.throttled:
+                self.pace(numTicks)
+
+    # Advances the clock by cycles skipped from within an instruction, like
+    # tickTimers but leaving posted requests to the run loop, which services
+    # them once the instruction has completed
+    def skipCycles(self, numCycles):
+        self.cycles += numCycles
+        self.delayCycle += numCycles
+        if self.delayCycle >= self.timerPeriod:
+            numTicks = self.delayCycle // self.timerPeriod
+            self.delayCycle -= numTicks * self.timerPeriod
+            self.D = max(self.D - numTicks, 0x0)
+            self.S = max(self.S - numTicks, 0x0)
+            if self.throttled:
+                self.pace(numTicks)
+
+    # Skips stop at the next timer tick while requests are pending, so that
+    # the tick of the skipping instruction services them
+    def skipLimit(self):
+        if self.throttled or self.requests:
+            return self.cycles + self.timerPeriod - self.delayCycle
+        return sys.maxsize
+
+    # Frames end at absolute deadlines, so the time spent running them does
+    # not add up to drift, and there is one sleep per frame rather than per
+    # instruction. After falling more than a few frames behind, pacing starts
+    # over instead of running the missed frames in a burst.
+    def pace(self, numFrames):
+        now = time.perf_counter()
+        if None == self.frameDeadline:
+            self.frameDeadline = now
+        self.frameDeadline += numFrames * FRAME_TIME
+        if self.frameDeadline > now:
+            time.sleep(self.frameDeadline - now)
+        elif now - self.frameDeadline > MAX_FRAMES_BEHIND * FRAME_TIME:
+            self.frameDeadline = now
+
+    # Called by an instruction that is waiting for input and will execute
+    # again on the next cycle. Skips the cycles up to the next scripted input
+    # event. When throttled, or when requests are pending, skips at most to
+    # the end of the frame, where the CPU sleeps or services them anyway.
+    def idle(self):
+        nextCycle = self.keyboard.nextEventCycle()
+        if NO_MORE_INPUT == nextCycle and sys.maxsize == self.endCycle:
+            # The input backend has run out of input, nothing can wake us up
+            self.running = False
+            return
+        if None == nextCycle and not self.throttled:
+            # Live input at full speed, nothing to skip
+            return
+
+        lastCycle = min(self.skipLimit(), self.endCycle)
+        if None != nextCycle:
+            lastCycle = min(nextCycle, lastCycle)
+        # The instruction itself accounts for one cycle
+        numSkipped = lastCycle - self.cycles - 1
+        if numSkipped > 0:
+            self.skipCycles(numSkipped)
+
+    # Runs one iteration of an idle loop without side effects, starting from
+    # the current registers overridden by regs, with the delay timer at dly.
+    # Returns the indices of the executed instructions and the registers
+    # after the iteration, or None if the iteration leaves the loop.
+    def loopIteration(self, loop, dly, regs):
+        V = dict(regs)
+        path = []
+        index = 0
+        while index < len(loop):
+            kind, x, nn = loop[index]
+            path.append(index)
+            val = V.get(x, self.V[x])
+            skip = False
+            if LOOP_JUMP == kind:
+                return path, V
+            elif LOOP_SKP_EQ == kind:
+                skip = val == nn
+            elif LOOP_SKP_NOT_EQ == kind:
+                skip = val != nn
+            elif LOOP_LD_REG == kind:
+                V[x] = nn
+            elif LOOP_SKP_KEY == kind:
+                skip = True == self.keyboard.keyPressed(val)
+            elif LOOP_SKP_NOT_KEY == kind:
+                skip = False == self.keyboard.keyPressed(val)
+            elif LOOP_GET_DLY_TIMER == kind:
+                V[x] = dly
+            index += 2 if skip else 1
+        return None
+
+    # Returns the registers an iteration with the timer at dly settles on
+    # when started from regs, or None unless the first iteration takes path
+    # and the second one takes it again and leaves the registers unchanged
+    def loopFixedPoint(self, loop, dly, regs, path):
+        result = self.loopIteration(loop, dly, regs)
+        if None == result or path != result[0]:
+            return None
+        regs = result[1]
+        result = self.loopIteration(loop, dly, regs)
+        if None == result or path != result[0] or regs != result[1]:
+            return None
+        return regs
+
+    # Called by the backward jump closing an idle loop, after an iteration
+    # has completed. Only loops whose registers have settled, so that every
+    # following iteration does exactly the same until the timer ticks, are
+    # fast forwarded. Skips all following iterations known to take the same
+    # path and settle again after every tick: up to the tick that breaks
+    # this, the next input event or the end of the run. When throttled, or
+    # when requests are pending, at most to the end of the frame.
+    def fastForwardLoop(self, loop):
+        result = self.loopIteration(loop, self.D, {})
+        if None == result:
+            return
+        path, regs = result
+        for x, val in regs.items():
+            if val != self.V[x]:
+                return
+        loopLength = len(path)
+
+        nextCycle = self.keyboard.nextEventCycle()
+        if None == nextCycle and not self.throttled:
+            # Live input at full speed, keys may change at any time
+            return
+
+        # Settled registers after each number of ticks
+        states = [regs]
+        lastCycle = self.endCycle
+        if None != nextCycle:
+            lastCycle = min(nextCycle, lastCycle)
+        nextTick = self.cycles + self.timerPeriod - self.delayCycle
+        lastCycle = min(self.skipLimit(), lastCycle)
+        if not self.throttled:
+            for numTicks in range(1, self.D + 1):
+                regs = self.loopFixedPoint(loop, self.D - numTicks, regs, path)
+                if None == regs:
+                    lastCycle = min(nextTick + (numTicks - 1) * self.timerPeriod, lastCycle)
+                    break
+                states.append(regs)
+        if sys.maxsize == lastCycle:
+            # Nothing will ever break the loop
+            return
+
+        # The jump itself accounts for one cycle
+        numIterations = (lastCycle - self.cycles - 1) // loopLength
+        if numIterations <= 0:
+            return
+
+        # Leave the registers as the last skipped iteration does, as settled
+        # for the timer value its timer read saw
+        numTicks = 0
+        firstCycle = self.cycles + (numIterations - 1) * loopLength + 1
+        for offset, index in enumerate(path):
+            kind, x, nn = loop[index]
+            if LOOP_GET_DLY_TIMER == kind:
+                cycle = firstCycle + offset
+                if cycle >= nextTick:
+                    numTicks = 1 + (cycle - nextTick) // self.timerPeriod
+        for x, val in states[min(numTicks, len(states) - 1)].items():
+            self.V[x] = val
+        self.skipCycles(numIterations * loopLength)
+
+    # Requests posted from other threads run on the CPU thread at the next
+    # timer tick, between two instructions
+    def post(self, request):
+        self.requests.append(request)
+
+    def serviceRequests(self):
+        while self.requests:
+            request = self.requests.popleft()
+            request(self)
+
+    def snapshot(self):
+        rngVersion, rngState, gauss = self.rng.getstate()
+        interrupt = self.interrupt
+        if None == interrupt:
+            interrupt = NO_INTERRUPT
+        return STATE_LAYOUT.pack(STATE_VERSION,
+                                 self.ram,
+                                 *self.vram,
+                                 self.V,
+                                 self.I,
+                                 self.pc,
+                                 self.sp,
+                                 *self.stack,
+                                 self.D,
+                                 self.S,
+                                 self.delayCycle,
+                                 self.cycles,
+                                 interrupt,
+                                 rngVersion,
+                                 *rngState,
+                                 None != gauss,
+                                 gauss or 0.0)
+
+    def restore(self, state):
+        fields = STATE_LAYOUT.unpack(state)
+        if STATE_VERSION != fields[0]:
+            raise ValueError("Unsupported save state version " + str(fields[0]))
+        index = 1
+        self.ram[:] = fields[index]
+        index += 1
+        self.vram[:] = array.array('Q', fields[index:index + VRAM_SIZE])
+        index += VRAM_SIZE
+        self.V[:] = fields[index]
+        self.I, self.pc, self.sp = fields[index + 1:index + 4]
+        index += 4
+        self.stack[:] = array.array('H', fields[index:index + STACK_SIZE])
+        index += STACK_SIZE
+        self.D, self.S, self.delayCycle, self.cycles, interrupt, rngVersion = fields[index:index + 6]
+        index += 6
+        rngState = fields[index:index + RNG_STATE_SIZE]
+        index += RNG_STATE_SIZE
+        hasGauss, gauss = fields[index:index + 2]
+        if not hasGauss:
+            gauss = None
+        self.rng.setstate((rngVersion, rngState, gauss))
+
+        self.interrupt = interrupt
+        if NO_INTERRUPT == interrupt:
+            self.interrupt = None
+        # A wait in progress begins anew, only seeing keys pressed from now on
+        self.waitingForKey = False
+        self.damage = [FULL_SCREEN]
+        if None != self.blockCache:
+            self.blockCache.clear()
 
     def stop(self):
         self.running = False
 
+    # Slice assignment would grow RAM to fit an oversized ROM
+    def load(self, bin):
+        if len(bin) > RAM_SIZE - PRG_START_ADDR:
+            raise ValueError("ROM of " + str(len(bin)) + " bytes does not fit in " + str(RAM_SIZE - PRG_START_ADDR) + " bytes of program memory")
+        self.ram[PRG_START_ADDR:PRG_START_ADDR + len(bin)] = bin
+
     def execProg(self, bin, debugger):
         self.debugger = debugger
-        byteAddr = 0
-        for byte in bin:
-            self.ram[PRG_START_ADDR + byteAddr] = byte
-            byteAddr += 1
+        self.load(bin)
+        # Set before starting the thread so that the frontend does not see
+        # the CPU as stopped while it is starting up
+        self.running = True
         self.start()
+
+    def start(self):
+        self.thread = threading.Thread(target = self.run)
+        self.thread.start()
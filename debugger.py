@@ -4,45 +4,134 @@ from cpu import NUM_REGISTERS
 from cpu import U16_MAX
 from cpu import PRG_START_ADDR
 
-STEP = 0xFFFFFFFF
-
+# The debugger is consulted by Cpu.runDebug between blocks, or between
+# instructions while stepping. Breakpoints may carry a condition and
+# watchpoints halt execution when the value of their expression changes.
+# Conditions and watchpoints are Python expressions over V, I, D, S, pc,
+# sp, stack and ram, e.g. "V[3] == 0x10" or "ram[0x300]".
 class Debugger(object):
     def __init__(self, cpu):
         self.cpu = cpu
         self.activated = False
+        self.stepping = False
         self.pc = U16_MAX
-        self.breakpoint = PRG_START_ADDR
+        self.breakpoints = {}
+        self.watchpoints = {}
+        self.setBreakpoint(PRG_START_ADDR)
 
     def activate(self):
         self.activated = True
+        self.breakpointsChanged()
+
+    def evaluate(self, code):
+        cpu = self.cpu
+        scope = {
+            "V": cpu.V,
+            "I": cpu.I,
+            "D": cpu.D,
+            "S": cpu.S,
+            "pc": cpu.pc,
+            "sp": cpu.sp,
+            "stack": cpu.stack,
+            "ram": cpu.ram,
+        }
+        return eval(code, {}, scope)
+
+    def compile(self, expression):
+        return compile(expression, "<debugger>", "eval")
+
+    def breakpointsChanged(self):
+        if self.activated and None != self.cpu.blockCache:
+            self.cpu.blockCache.setStopAddresses(self.breakpoints.keys())
+
+    def setBreakpoint(self, addr, condition = None):
+        code = None
+        if None != condition:
+            code = self.compile(condition)
+        self.breakpoints[addr] = (condition, code)
+        self.breakpointsChanged()
+
+    def clearBreakpoint(self, addr):
+        self.breakpoints.pop(addr, None)
+        self.breakpointsChanged()
+
+    def setWatchpoint(self, expression):
+        code = self.compile(expression)
+        self.watchpoints[expression] = (code, self.evaluate(code))
+
+    def clearWatchpoint(self, expression):
+        self.watchpoints.pop(expression, None)
+
+    def check(self):
+        reason = None
+        if self.stepping:
+            reason = "Execution halted at " + hex(self.cpu.pc)
+        elif self.cpu.pc in self.breakpoints:
+            condition, code = self.breakpoints[self.cpu.pc]
+            if None == code or self.evaluate(code):
+                reason = "Breakpoint hit at " + hex(self.cpu.pc)
+
+        for expression, (code, oldValue) in list(self.watchpoints.items()):
+            value = self.evaluate(code)
+            if value != oldValue:
+                self.watchpoints[expression] = (code, value)
+                reason = "Watchpoint " + expression + " changed from " + str(oldValue) + " to " + str(value)
+
+        if None != reason:
+            print(reason)
+            self.halt()
+
+    def printState(self):
+        print("Registers: ")
+        for i in range(NUM_REGISTERS):
+            print("V[" + hex(i) + "] = " + hex(self.cpu.V[i]))
+        print("I: " + hex(self.cpu.I))
+        print("PC: " + hex(self.cpu.pc))
+        print("SP: " + hex(self.cpu.sp))
+        instr = self.cpu.ram[self.cpu.pc] << 8 | self.cpu.ram[self.cpu.pc + 1]
+        print("Next instruction: " + hex(instr))
+
+        if self.stepping and self.pc == self.cpu.pc:
+            print("Execution hanging at " + hex(self.cpu.pc))
+        self.pc = self.cpu.pc
 
-    def trace(self):
-        if True == self.activated:
-            if None != self.breakpoint:
-                if self.cpu.pc == self.breakpoint or STEP == self.breakpoint:
-                    print("Execution halted at " + hex(self.cpu.pc))
-                    print("Enter next breakpoint, \"step\" or \"run\" followed by enter to continue execution: ")
-                    self.breakpoint = input()
-                    if "step" == self.breakpoint or "s" == self.breakpoint:
-                        self.breakpoint = STEP
-                    elif "run" == self.breakpoint or "r" == self.breakpoint:
-                        self.breakpoint = None
-                    else:
-                        try:
-                            self.breakpoint = int(self.breakpoint, 16)
-                            print("New breakpoint: " + hex(self.breakpoint))
-                        except ValueError:
-                            self.breakpoint = STEP
-            print("Registers: ")
-            for i in range(NUM_REGISTERS):
-                print("V[" + hex(i) + "] = " + hex(self.cpu.V[i]))
-            print("I: " + hex(self.cpu.I))
-            print("PC: " + hex(self.cpu.pc))
-            print("SP: " + hex(self.cpu.sp))
-            instr = self.cpu.ram[self.cpu.pc] << 8 | self.cpu.ram[self.cpu.pc + 1]
-            print("Next instruction: " + hex(instr))
-
-            if self.pc == self.cpu.pc:
-                print("Execution hanging at " + hex(self.cpu.pc))
-                #self.cpu.stop()
-            self.pc = self.cpu.pc
+    def halt(self):
+        self.printState()
+        while True:
+            print("Enter \"step\", \"continue\", \"run\", a new breakpoint or one of")
+            print("\"b <addr> [condition]\", \"d <addr>\", \"w <expr>\", \"u <expr>\" or \"p <expr>\": ")
+            command = input().strip()
+            name, sep, argument = command.partition(" ")
+            argument = argument.strip()
+            try:
+                if "" == command or "step" == command or "s" == command:
+                    self.stepping = True
+                    return
+                elif "continue" == command or "c" == command:
+                    self.stepping = False
+                    return
+                elif "run" == command or "r" == command:
+                    self.stepping = False
+                    self.breakpoints = {}
+                    self.watchpoints = {}
+                    self.breakpointsChanged()
+                    return
+                elif "b" == name:
+                    addr, sep, condition = argument.partition(" ")
+                    self.setBreakpoint(int(addr, 16), condition.strip() or None)
+                    print("New breakpoint: " + addr)
+                elif "d" == name:
+                    self.clearBreakpoint(int(argument, 16))
+                elif "w" == name:
+                    self.setWatchpoint(argument)
+                elif "u" == name:
+                    self.clearWatchpoint(argument)
+                elif "p" == name:
+                    print(self.evaluate(self.compile(argument)))
+                else:
+                    self.setBreakpoint(int(command, 16))
+                    print("New breakpoint: " + hex(int(command, 16)))
+                    self.stepping = False
+                    return
+            except (ValueError, SyntaxError, NameError, IndexError, TypeError) as error:
+                print("Invalid command: " + str(error))
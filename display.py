@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+SCREEN_X_SIZE = 64
+SCREEN_Y_SIZE = 32
+
+# Damaged regions are (x, y, width, height) rectangles in screen pixels
+FULL_SCREEN = (0, 0, SCREEN_X_SIZE, SCREEN_Y_SIZE)
+
+# Unpacked pixel values, one byte per pixel, for every possible byte of a
+# packed VRAM row
+PIXEL_BYTES = [bytes([(byte >> (7 - bit)) & 1 for bit in range(8)]) for byte in range(256)]
+
+def unpackRow(row):
+    return b"".join([PIXEL_BYTES[byte] for byte in row.to_bytes(SCREEN_X_SIZE // 8, 'big')])
+
+# Splits a span that may wrap around the edge of the screen into at most
+# two (start, length) spans that do not
+def wrapSpans(start, length, size):
+    start = start % size
+    if start + length <= size:
+        return [(start, length)]
+    return [(start, size - start), (0, start + length - size)]
+
+class NullGpu(object):
+    def __init__(self):
+        self.cpu = None
+
+    def render(self, vram, damage = None):
+        pass
+
+    def setCpu(self, cpu):
+        self.cpu = cpu
+
+class ArrayGpu(object):
+    def __init__(self):
+        self.cpu = None
+        self.frame = None
+        self.numFrames = 0
+
+    def render(self, vram, damage = None):
+        self.frame = list(vram)
+        self.numFrames += 1
+
+    def setCpu(self, cpu):
+        self.cpu = cpu
@@ -1,37 +1,125 @@
 #!/usr/bin/env python3
 
 import pygame
+import asyncio
 from rom import Rom
 from cpu import Cpu
+from cpu import DELAY_CYCLE_LENGTH
 from gpu import Gpu
+from gpu import PRESENT_FREQ_IN_HZ
+from keyboard import Keyboard
+from keypad import ScriptedKeypad
+from keypad import RecordingKeypad
+from keypad import loadScript
 from debugger import Debugger
+from profiler import Profiler
+from scheduler import runSession
+from aot import loadCompiled
+from capture import FrameCapture
+from capture import FORMAT_PNG
 
 class Emu(object):
-    def __init__(self, debug, graphicsScale):
+    def __init__(self, debug, graphicsScale, jit = False, throttled = True, profilePath = None, recordPath = None, playPath = None, asyncLoop = False, instructionsPerFrame = DELAY_CYCLE_LENGTH, aot = False, capturePath = None, captureFormat = FORMAT_PNG):
         self.rom = Rom()
         self.gpu = Gpu(graphicsScale)
-        self.cpu = Cpu(self.gpu)
-        self.gpu.setCpu(self.cpu)
+        self.keyboard = Keyboard()
+        self.recordPath = recordPath
+        keypad = self.keyboard
+        if None != playPath:
+            keypad = ScriptedKeypad(loadScript(playPath))
+        if None != recordPath:
+            # When also playing a script, records the input the ROM saw
+            keypad = RecordingKeypad(keypad)
+        self.throttled = throttled
+        self.asyncLoop = asyncLoop
+        self.aot = aot
+        self.capture = None
+        if None != capturePath:
+            self.capture = FrameCapture(capturePath, captureFormat)
+            self.gpu.capture = self.capture
+        # On the event loop the scheduler paces the CPU instead
+        self.cpu = Cpu(self.gpu, keypad, jit, throttled and not asyncLoop, instructionsPerFrame)
+        self.statePath = None
+        self.profilePath = profilePath
+        if None != self.profilePath:
+            self.cpu.profiler = Profiler()
+            self.cpu.profiler.attachGpu(self.gpu)
         self.debugger = None
         self.debugger = Debugger(self.cpu)
         if True == debug:
             self.debugger.activate()
 
     def run(self, binPath):
+        self.statePath = binPath + ".state"
         self.rom.load(binPath)
-        self.cpu.execProg(self.rom.romData, self.debugger)
-        self.pyGameMainLoop()
+        if True == self.aot:
+            self.cpu.load(self.rom.romData)
+            loadCompiled(self.cpu, self.rom.hash)
+        if True == self.asyncLoop:
+            self.cpu.debugger = self.debugger
+            self.cpu.load(self.rom.romData)
+            asyncio.run(runSession(self.cpu, self.throttled, self.presentFrame))
+            self.shutdown()
+        else:
+            self.cpu.execProg(self.rom.romData, self.debugger)
+            self.pyGameMainLoop()
 
+    # Handles input and presents the frames drawn by the CPU thread, at most
+    # once per display refresh
     def pyGameMainLoop(self):
+        clock = pygame.time.Clock()
         while 1:
-            event = pygame.event.wait()
+            self.handleEvents()
+            if False == self.cpu.running:
+                self.cpu.thread.join()
+                self.shutdown()
+
+            self.gpu.present()
+            clock.tick(PRESENT_FREQ_IN_HZ)
+
+    # Called by the scheduler between CPU time slices when running on the
+    # event loop
+    def presentFrame(self, cpu):
+        self.handleEvents()
+        self.gpu.present()
+
+    def handleEvents(self):
+        for event in pygame.event.get():
             if event.type == pygame.KEYDOWN:
-                keysPressed = pygame.key.get_pressed()
-                self.cpu.keyboard.keyPressedIndication(keysPressed)
-                if keysPressed[pygame.K_q]:
+                self.keyboard.keyDown(event.key)
+                if event.key == pygame.K_q:
                     self.cpu.stop()
+                if event.key == pygame.K_F5:
+                    self.cpu.post(self.saveState)
+                if event.key == pygame.K_F9:
+                    self.cpu.post(self.loadState)
+            if event.type == pygame.KEYUP:
+                self.keyboard.keyUp(event.key)
             if event.type == pygame.QUIT:
                 self.cpu.stop()
 
-            if False == self.cpu.running:
-                raise SystemExit
+    def shutdown(self):
+        if None != self.capture:
+            self.capture.close()
+        if None != self.profilePath:
+            self.cpu.profiler.write(self.profilePath)
+        if None != self.recordPath:
+            self.cpu.keyboard.save(self.recordPath)
+        raise SystemExit
+
+    # Save states are taken and restored on the CPU thread, see Cpu.post
+    def saveState(self, cpu):
+        with open(self.statePath, 'wb') as file:
+            file.write(cpu.snapshot())
+        print("State saved to " + self.statePath)
+
+    def loadState(self, cpu):
+        try:
+            with open(self.statePath, 'rb') as file:
+                state = file.read()
+        except IOError:
+            print("No saved state at " + self.statePath)
+            return
+        cpu.restore(state)
+        cpu.interruptTable.drawGraphics(cpu)
+        print("State loaded from " + self.statePath)
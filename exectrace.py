@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+
+import sys
+import struct
+from rom import Rom
+from cpu import Cpu
+from cpu import NUM_REGISTERS
+from keypad import ScriptedKeypad
+from keypad import loadScript
+
+TRACE_MAGIC       = b"C8TR"
+TRACE_VERSION     = 0x2
+TRACE_BUFFER_SIZE = 1 << 20
+
+# File header: magic, version, the number of cycles the traced run was
+# given and the length of the save state of the CPU when tracing started,
+# followed by the save state itself. Idle CPUs skip ahead up to the end of
+# the run, so a replay has to be given the same number of cycles.
+TRACE_HEADER = struct.Struct("<4sBQI")
+UNBOUNDED    = (1 << 64) - 1
+
+# Every executed instruction is recorded as pc, opcode and a mask of the
+# registers it changed, followed by the new values of those registers: one
+# byte per changed V register, then I as 32 bits, then SP, D and S as one
+# byte each
+RECORD_HEADER = struct.Struct("<HHI")
+CHANGED_I     = 1 << NUM_REGISTERS
+CHANGED_SP    = CHANGED_I << 1
+CHANGED_D     = CHANGED_I << 2
+CHANGED_S     = CHANGED_I << 3
+I_FORMAT      = struct.Struct("<I")
+
+def encodeRecord(pc, opcode, cpu, oldV, oldI, oldSp, oldD, oldS):
+    mask = 0
+    values = b""
+    if cpu.V != oldV:
+        changed = []
+        for reg in range(NUM_REGISTERS):
+            if cpu.V[reg] != oldV[reg]:
+                mask |= 1 << reg
+                changed.append(cpu.V[reg])
+        values = bytes(changed)
+    if cpu.I != oldI:
+        mask |= CHANGED_I
+        values += I_FORMAT.pack(cpu.I)
+    if cpu.sp != oldSp:
+        mask |= CHANGED_SP
+        values += bytes([cpu.sp])
+    if cpu.D != oldD:
+        mask |= CHANGED_D
+        values += bytes([cpu.D])
+    if cpu.S != oldS:
+        mask |= CHANGED_S
+        values += bytes([cpu.S])
+    return RECORD_HEADER.pack(pc, opcode, mask) + values
+
+def payloadSize(mask):
+    size = bin(mask & (CHANGED_I - 1)).count("1")
+    if mask & CHANGED_I:
+        size += I_FORMAT.size
+    for flag in (CHANGED_SP, CHANGED_D, CHANGED_S):
+        if mask & flag:
+            size += 1
+    return size
+
+def decodeRecord(record):
+    pc, opcode, mask = RECORD_HEADER.unpack_from(record)
+    offset = RECORD_HEADER.size
+    changes = []
+    for reg in range(NUM_REGISTERS):
+        if mask & (1 << reg):
+            changes.append("V[" + hex(reg) + "]=" + hex(record[offset]))
+            offset += 1
+    if mask & CHANGED_I:
+        changes.append("I=" + hex(I_FORMAT.unpack_from(record, offset)[0]))
+        offset += I_FORMAT.size
+    for flag, name in ((CHANGED_SP, "SP"), (CHANGED_D, "D"), (CHANGED_S, "S")):
+        if mask & flag:
+            changes.append(name + "=" + hex(record[offset]))
+            offset += 1
+    return hex(pc) + ": " + format(opcode, '04X') + " " + " ".join(changes)
+
+class TraceWriter(object):
+    def __init__(self, path):
+        self.file = open(path, 'wb', TRACE_BUFFER_SIZE)
+        self.numRecords = 0
+        self.started = False
+
+    # Called whenever a traced run starts, only the first one writes the
+    # header
+    def begin(self, cpu):
+        if self.started:
+            return
+        self.started = True
+        state = cpu.snapshot()
+        numCycles = UNBOUNDED
+        if sys.maxsize != cpu.endCycle:
+            numCycles = cpu.endCycle - cpu.cycles
+        self.file.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION, numCycles, len(state)))
+        self.file.write(state)
+
+    def record(self, pc, opcode, cpu, oldV, oldI, oldSp, oldD, oldS):
+        self.file.write(encodeRecord(pc, opcode, cpu, oldV, oldI, oldSp, oldD, oldS))
+        self.numRecords += 1
+
+    def close(self):
+        self.file.close()
+
+class TraceReader(object):
+    def __init__(self, path):
+        self.file = open(path, 'rb', TRACE_BUFFER_SIZE)
+        magic, version, numCycles, stateSize = TRACE_HEADER.unpack(self.file.read(TRACE_HEADER.size))
+        if TRACE_MAGIC != magic or TRACE_VERSION != version:
+            raise ValueError(path + " is not a version " + str(TRACE_VERSION) + " trace")
+        self.numCycles = None
+        if UNBOUNDED != numCycles:
+            self.numCycles = numCycles
+        self.state = self.file.read(stateSize)
+
+    # Returns the next raw record, or None at the end of the trace
+    def next(self):
+        header = self.file.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            return None
+        pc, opcode, mask = RECORD_HEADER.unpack(header)
+        return header + self.file.read(payloadSize(mask))
+
+    def close(self):
+        self.file.close()
+
+# Used in place of a TraceWriter, compares what the CPU executes against a
+# recorded trace and stops the CPU at the first divergence
+class TraceChecker(object):
+    def __init__(self, reader):
+        self.reader = reader
+        self.numRecords = 0
+        self.expected = None
+        self.actual = None
+
+    def begin(self, cpu):
+        pass
+
+    def record(self, pc, opcode, cpu, oldV, oldI, oldSp, oldD, oldS):
+        actual = encodeRecord(pc, opcode, cpu, oldV, oldI, oldSp, oldD, oldS)
+        expected = self.reader.next()
+        if None == expected:
+            cpu.stop()
+        elif actual != expected:
+            self.expected = expected
+            self.actual = actual
+            cpu.stop()
+        else:
+            self.numRecords += 1
+
+    def close(self):
+        self.reader.close()
+
+def printDivergence(index, expected, actual, end = "<end of trace>"):
+    print("Traces diverge at instruction " + str(index))
+    for name, record in (("expected", expected), ("actual", actual)):
+        if None == record:
+            print("  " + name + ": " + end)
+        else:
+            print("  " + name + ": " + decodeRecord(record))
+
+def diffTraces(pathA, pathB):
+    readerA = TraceReader(pathA)
+    readerB = TraceReader(pathB)
+    if readerA.state != readerB.state:
+        print("Warning: traces start from different states")
+    index = 0
+    while True:
+        recordA = readerA.next()
+        recordB = readerB.next()
+        if recordA != recordB:
+            printDivergence(index, recordA, recordB)
+            return False
+        if None == recordA:
+            print("Traces are identical, " + str(index) + " instructions")
+            return True
+        index += 1
+
+def makeCpu(scriptPath):
+    events = []
+    if None != scriptPath:
+        events = loadScript(scriptPath)
+    return Cpu(None, ScriptedKeypad(events), False, False)
+
+def recordTrace(romPath, tracePath, numCycles, scriptPath = None, seed = None):
+    rom = Rom()
+    rom.load(romPath)
+    cpu = makeCpu(scriptPath)
+    if None != seed:
+        cpu.rng.seed(seed)
+    cpu.load(rom.romData)
+    cpu.tracer = TraceWriter(tracePath)
+    cpu.runFor(numCycles)
+    cpu.tracer.close()
+    print("Recorded " + str(cpu.tracer.numRecords) + " instructions to " + tracePath)
+
+# Restores the state the trace started from and runs the emulator against
+# the trace, for as many cycles as the traced run, until it ends or diverges.
+# A replay stopping before the end of the trace, e.g. on an illegal
+# instruction, diverges too.
+def replayTrace(tracePath, scriptPath = None):
+    reader = TraceReader(tracePath)
+    cpu = makeCpu(scriptPath)
+    cpu.restore(reader.state)
+    checker = TraceChecker(reader)
+    cpu.tracer = checker
+    cpu.runFor(reader.numCycles)
+    if None == checker.expected:
+        checker.expected = reader.next()
+    checker.close()
+    if None != checker.expected:
+        printDivergence(checker.numRecords, checker.expected, checker.actual, "<end of replay>")
+        return False
+    print("Replay matches the trace, " + str(checker.numRecords) + " instructions")
+    return True
+
+def argValue(flag, default = None):
+    if flag in sys.argv:
+        index = sys.argv.index(flag)
+        return sys.argv[index + 1]
+    return default
+
+if "__main__" == __name__:
+    command = None
+    if len(sys.argv) > 1:
+        command = sys.argv[1]
+    if "record" == command:
+        seed = argValue('-seed')
+        if None != seed:
+            seed = int(seed)
+        recordTrace(argValue('-r'), argValue('-o'), int(argValue('-c', 100000)), argValue('-i'), seed)
+    elif "replay" == command and len(sys.argv) > 2:
+        if not replayTrace(sys.argv[2], argValue('-i')):
+            raise SystemExit(1)
+    elif "diff" == command and len(sys.argv) > 3:
+        if not diffTraces(sys.argv[2], sys.argv[3]):
+            raise SystemExit(1)
+    else:
+        print("Usage: python3 exectrace.py record -r <rom> -o <trace> [-c cycles] [-i script] [-seed seed]")
+        print("       python3 exectrace.py replay <trace> [-i script]")
+        print("       python3 exectrace.py diff <trace> <trace>")
@@ -1,16 +1,29 @@
 #!/usr/bin/env python3
 
 import pygame
-
-SCREEN_X_SIZE = 64
-SCREEN_Y_SIZE = 32
+import threading
+from display import SCREEN_X_SIZE
+from display import SCREEN_Y_SIZE
+from display import FULL_SCREEN
+from display import unpackRow
 
 COLORS = (pygame.Color(192, 192, 192, 255),
           pygame.Color(100, 80, 255, 255))
 
+PRESENT_FREQ_IN_HZ = 60 # Hz
+MAX_DAMAGE_RECTS   = 32
+
 class Gpu(object):
     def __init__(self, scale):
         self.cpu = None
+        self.vram = None
+        self.damage = []
+        self.dirty = False
+        self.lock = threading.Lock()
+        # Presented frames are handed to the capture, if any, numbered by
+        # display refresh
+        self.capture = None
+        self.numPresented = 0
         self.scale = scale
         if None == self.scale:
             self.scale = 1
@@ -19,32 +32,74 @@ class Gpu(object):
 
         pygame.display.set_caption("PyCHIP-8")
 
+        # The unscaled frame is a palettized 8 bit surface holding one byte
+        # per pixel, so VRAM can be copied straight into its pixel buffer
+        self.frame = pygame.Surface((SCREEN_X_SIZE, SCREEN_Y_SIZE), 0, 8)
+        self.frame.set_palette(COLORS)
+        self.frame.fill(0)
+
         self.surface = pygame.Surface((SCREEN_X_SIZE * self.scale,
                                        SCREEN_Y_SIZE * self.scale),
                                        pygame.HWSURFACE | pygame.DOUBLEBUF,
                                        8)
-        self.surface.fill(COLORS[0])
+        self.surface.set_palette(COLORS)
+        self.surface.fill(0)
         self.display.blit(self.surface, (0, 0))
         pygame.display.flip()
 
-    def drawPixel(self, xPos, yPos, color):
-        xStart = xPos * self.scale
-        yStart = yPos * self.scale
-        pygame.draw.rect(self.surface,
-                         COLORS[color],
-                         (xStart, yStart, self.scale, self.scale))
-
-    def render(self, vram):
-        x = 0
-        y = 0
-        for byte in vram:
-            self.drawPixel(x, y, byte)
-            x += 1
-            if x == SCREEN_X_SIZE:
-                y += 1
-                x = 0
-        self.display.blit(self.surface, (0, 0))
-        pygame.display.flip()
+    def uploadRows(self, vram, rows):
+        pitch = self.frame.get_pitch()
+        pixelBuffer = self.frame.get_buffer()
+        for y in rows:
+            pixelBuffer.write(unpackRow(vram[y]), y * pitch)
+        # Releasing the buffer unlocks the surface again
+        del pixelBuffer
+
+    # Called from the CPU thread, only records what needs to be redrawn.
+    # The actual drawing is done by present, at most once per refresh.
+    def render(self, vram, damage = None):
+        with self.lock:
+            self.vram = vram
+            if None == damage:
+                self.damage.append(FULL_SCREEN)
+            else:
+                self.damage.extend(damage)
+            self.dirty = True
+
+    def present(self):
+        self.numPresented += 1
+        with self.lock:
+            if not self.dirty:
+                return
+            vram = list(self.vram)
+            damage = set(self.damage)
+            self.damage = []
+            self.dirty = False
+        if FULL_SCREEN in damage or len(damage) > MAX_DAMAGE_RECTS:
+            damage = [FULL_SCREEN]
+        self.draw(vram, damage)
+        if None != self.capture:
+            self.capture.capture(vram, self.numPresented)
+
+    # Copies the damaged rows of VRAM into the frame, scales it up to the
+    # window size in one go and updates only the damaged regions of the
+    # screen
+    def draw(self, vram, damage):
+        rows = set()
+        for xStart, yStart, width, height in damage:
+            rows.update(range(yStart, yStart + height))
+        self.uploadRows(vram, sorted(rows))
+        pygame.transform.scale(self.frame, self.surface.get_size(), self.surface)
+
+        updateRects = []
+        for xStart, yStart, width, height in damage:
+            rect = pygame.Rect(xStart * self.scale,
+                               yStart * self.scale,
+                               width * self.scale,
+                               height * self.scale)
+            self.display.blit(self.surface, rect, rect)
+            updateRects.append(rect)
+        pygame.display.update(updateRects)
 
     def setCpu(self, cpu):
         self.cpu = cpu
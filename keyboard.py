@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 
 import pygame
-import threading
+import collections
+from keypad import MAX_QUEUED_KEY_PRESSES
 
 KEYS = {
     0x0: pygame.K_KP0,
@@ -22,31 +23,44 @@ KEYS = {
     0xF: pygame.K_f,
 }
 
+# Keypad keys by pygame key code
+KEY_CODES = {keyCode: keyVal for keyVal, keyCode in KEYS.items()}
+
+# The state of the keypad is a bitmask with one bit per key, set and
+# cleared by the pygame event loop and read by the CPU thread. Replacing an
+# int and appending to or popping from a deque are atomic, so neither side
+# needs a lock, and the CPU never calls into SDL.
 class Keyboard(object):
     def __init__(self):
-        self.pressedKeys = None
-        self.pressedKeysCond = threading.Condition()
+        self.pressedKeys = 0
+        self.keyPresses = collections.deque(maxlen = MAX_QUEUED_KEY_PRESSES)
+        self.cpu = None
+
+    def setCpu(self, cpu):
+        self.cpu = cpu
 
     def keyPressed(self, keyToCheck):
-        retVal = False
-        pressedKeys = pygame.key.get_pressed()
-        if pressedKeys[KEYS[keyToCheck]]:
-            retVal = True
-        return retVal
-
-    def keyPressedIndication(self, pressedKeys):
-        with self.pressedKeysCond:
-            self.pressedKeys = pressedKeys
-            self.pressedKeysCond.notifyAll()
-
-    def waitKeyPressed(self):
-        keyVal = None
-        keyPressed = False
-        while not keyPressed:
-            with self.pressedKeysCond:
-                self.pressedKeysCond.wait()
-                for keyVal, lookupKey in KEYS.items():
-                    if self.pressedKeys[lookupKey]:
-                        keyPressed = True
-                        break
-        return keyVal
+        return 0 != (self.pressedKeys & (1 << keyToCheck))
+
+    def keyDown(self, keyCode):
+        keyVal = KEY_CODES.get(keyCode)
+        if None != keyVal:
+            self.pressedKeys |= 1 << keyVal
+            self.keyPresses.append(keyVal)
+
+    def keyUp(self, keyCode):
+        keyVal = KEY_CODES.get(keyCode)
+        if None != keyVal:
+            self.pressedKeys &= ~(1 << keyVal)
+
+    def beginWait(self):
+        self.keyPresses.clear()
+
+    def pollKeyPress(self):
+        if self.keyPresses:
+            return self.keyPresses.popleft()
+        return None
+
+    # Live input, there is no telling when the next key press comes
+    def nextEventCycle(self):
+        return None
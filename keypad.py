@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+import sys
+import collections
+
+NUM_KEYS = 0x10
+
+KEY_DOWN = "down"
+KEY_UP   = "up"
+
+# Returned by nextEventCycle when no more input will ever arrive
+NO_MORE_INPUT = sys.maxsize
+
+# Live backends queue key presses for FX0A, which only takes the first one
+# pressed since its wait began. The queue only empties when a wait begins,
+# so it is bounded, the oldest presses being dropped when it is full.
+MAX_QUEUED_KEY_PRESSES = 16
+
+# Input backends are polled by FX0A through beginWait and pollKeyPress,
+# which returns a key pressed since the wait began or None. While nothing
+# is pressed, nextEventCycle tells the CPU up to which cycle it can skip
+# ahead, or None for live input.
+class NullKeypad(object):
+    def __init__(self):
+        self.cpu = None
+
+    def setCpu(self, cpu):
+        self.cpu = cpu
+
+    def keyPressed(self, keyToCheck):
+        return False
+
+    def beginWait(self):
+        pass
+
+    def pollKeyPress(self):
+        return None
+
+    def nextEventCycle(self):
+        return NO_MORE_INPUT
+
+class ScriptedKeypad(object):
+    def __init__(self, events):
+        self.cpu = None
+        self.events = sorted(events, key = lambda event: event[0])
+        self.eventIndex = 0
+        self.pressedKeys = [False] * NUM_KEYS
+
+    def setCpu(self, cpu):
+        self.cpu = cpu
+
+    def applyEvent(self):
+        cycle, key, pressed = self.events[self.eventIndex]
+        self.pressedKeys[key] = pressed
+        self.eventIndex += 1
+
+    def update(self, endCycle):
+        while self.eventIndex < len(self.events) and self.events[self.eventIndex][0] < endCycle:
+            self.applyEvent()
+
+    def keyPressed(self, keyToCheck):
+        self.update(self.cpu.cycles + 1)
+        return self.pressedKeys[keyToCheck]
+
+    # Only key presses from the cycle the wait began and later end it
+    def beginWait(self):
+        self.update(self.cpu.cycles)
+
+    def pollKeyPress(self):
+        while self.eventIndex < len(self.events) and self.events[self.eventIndex][0] <= self.cpu.cycles:
+            cycle, key, pressed = self.events[self.eventIndex]
+            self.applyEvent()
+            if pressed:
+                return key
+        return None
+
+    def nextEventCycle(self):
+        if self.eventIndex < len(self.events):
+            return self.events[self.eventIndex][0]
+        return NO_MORE_INPUT
+
+# Live input fed with key numbers from outside, e.g. over a socket. Like the
+# pygame Keyboard it keeps the keypad as a bitmask.
+class RemoteKeypad(object):
+    def __init__(self):
+        self.cpu = None
+        self.pressedKeys = 0
+        self.keyPresses = collections.deque(maxlen = MAX_QUEUED_KEY_PRESSES)
+
+    def setCpu(self, cpu):
+        self.cpu = cpu
+
+    def keyPressed(self, keyToCheck):
+        return 0 != (self.pressedKeys & (1 << keyToCheck))
+
+    def keyDown(self, key):
+        self.pressedKeys |= 1 << key
+        self.keyPresses.append(key)
+
+    def keyUp(self, key):
+        self.pressedKeys &= ~(1 << key)
+
+    def beginWait(self):
+        self.keyPresses.clear()
+
+    def pollKeyPress(self):
+        if self.keyPresses:
+            return self.keyPresses.popleft()
+        return None
+
+    def nextEventCycle(self):
+        return None
+
+# Wraps another input backend and records every change in key state that
+# the CPU observes, indexed by cycle. Played back with a ScriptedKeypad, the
+# recording makes the CPU see exactly the same input at the same cycles.
+class RecordingKeypad(object):
+    def __init__(self, keyboard):
+        self.cpu = None
+        self.keyboard = keyboard
+        self.events = []
+        self.pressedKeys = [False] * NUM_KEYS
+
+    def setCpu(self, cpu):
+        self.cpu = cpu
+        self.keyboard.setCpu(cpu)
+
+    def keyPressed(self, keyToCheck):
+        pressed = self.keyboard.keyPressed(keyToCheck)
+        if pressed != self.pressedKeys[keyToCheck]:
+            self.pressedKeys[keyToCheck] = pressed
+            self.events.append((self.cpu.cycles, keyToCheck, pressed))
+        return pressed
+
+    def beginWait(self):
+        self.keyboard.beginWait()
+
+    def pollKeyPress(self):
+        key = self.keyboard.pollKeyPress()
+        if None != key:
+            self.pressedKeys[key] = True
+            self.events.append((self.cpu.cycles, key, True))
+        return key
+
+    def nextEventCycle(self):
+        return self.keyboard.nextEventCycle()
+
+    def save(self, path):
+        saveScript(path, self.events)
+
+# Input scripts hold one event per line: "<cycle> <key> <down|up>", with
+# the key given as a hex digit. Lines starting with # are ignored.
+def loadScript(path):
+    events = []
+    with open(path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            cycle, key, state = line.split()
+            events.append((int(cycle), int(key, 16), KEY_DOWN == state))
+    return events
+
+def saveScript(path, events):
+    with open(path, 'w') as file:
+        for cycle, key, pressed in events:
+            state = KEY_UP
+            if pressed:
+                state = KEY_DOWN
+            file.write(str(cycle) + " " + format(key, 'X') + " " + state + "\n")
@@ -2,23 +2,63 @@
 
 import sys
 from emu import Emu
+from cpu import DELAY_CYCLE_LENGTH
 
 if "__main__" == __name__:
     debug = False
+    jit = False
+    throttled = True
+    profilePath = None
+    recordPath = None
+    playPath = None
+    asyncLoop = False
+    aot = False
+    capturePath = None
+    captureFormat = "png"
+    instructionsPerFrame = DELAY_CYCLE_LENGTH
     romPath = None
     graphicsScale = 5
     print(str(sys.argv))
     if len(sys.argv) > 0:
         if '-db' in sys.argv:
             debug = True
+        if '-j' in sys.argv:
+            jit = True
+        if '-t' in sys.argv:
+            throttled = False
+        if '-a' in sys.argv:
+            asyncLoop = True
+        if '-aot' in sys.argv:
+            # Compiled blocks are run through the block cache
+            jit = True
+            aot = True
         if '-r' in sys.argv:
             index = sys.argv.index('-r')
             romPath = sys.argv[index + 1]
+        if '-p' in sys.argv:
+            index = sys.argv.index('-p')
+            profilePath = sys.argv[index + 1]
+        if '-rec' in sys.argv:
+            index = sys.argv.index('-rec')
+            recordPath = sys.argv[index + 1]
+        if '-play' in sys.argv:
+            index = sys.argv.index('-play')
+            playPath = sys.argv[index + 1]
+        if '-ipf' in sys.argv:
+            # CPU speed, in instructions per 60 Hz frame
+            index = sys.argv.index('-ipf')
+            instructionsPerFrame = int(sys.argv[index + 1])
+        if '-cap' in sys.argv:
+            index = sys.argv.index('-cap')
+            capturePath = sys.argv[index + 1]
+        if '-capfmt' in sys.argv:
+            index = sys.argv.index('-capfmt')
+            captureFormat = sys.argv[index + 1]
         if '-s' in sys.argv:
             index = sys.argv.index('-s')
             graphicsScale =int(sys.argv[index + 1])
 
-    emu = Emu(debug, graphicsScale)
+    emu = Emu(debug, graphicsScale, jit, throttled, profilePath, recordPath, playPath, asyncLoop, instructionsPerFrame, aot, capturePath, captureFormat)
     if None != romPath:
         emu.run(romPath)
     else:
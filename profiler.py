@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import time
+import json
+
+NUM_FAMILIES = 0x10
+NUM_HOT_PCS  = 20
+
+class TimedStat(object):
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.minTime = None
+        self.maxTime = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.time += elapsed
+        if None == self.minTime or elapsed < self.minTime:
+            self.minTime = elapsed
+        if elapsed > self.maxTime:
+            self.maxTime = elapsed
+
+    def toDict(self):
+        meanTime = 0.0
+        if self.count > 0:
+            meanTime = self.time / self.count
+        return {
+            "count": self.count,
+            "time": self.time,
+            "minTime": self.minTime or 0.0,
+            "maxTime": self.maxTime,
+            "meanTime": meanTime,
+        }
+
+# Collects execution statistics from Cpu.runProfiled. All times are in
+# seconds of host time.
+class Profiler(object):
+    def __init__(self):
+        self.families = [TimedStat() for i in range(NUM_FAMILIES)]
+        self.handlers = {}
+        self.pcCounts = {}
+        self.frames = TimedStat()
+        self.renders = TimedStat()
+        self.presents = TimedStat()
+        self.numInstructions = 0
+        self.startTime = None
+        self.frameStart = None
+        self.runTime = 0.0
+
+    def start(self):
+        self.startTime = time.perf_counter()
+        self.frameStart = self.startTime
+
+    def stop(self):
+        if None != self.startTime:
+            self.runTime += time.perf_counter() - self.startTime
+            self.startTime = None
+
+    def record(self, pc, opcode, handler, elapsed):
+        self.numInstructions += 1
+        self.families[opcode >> 12].add(elapsed)
+        name = handler.func.__name__
+        stat = self.handlers.get(name)
+        if None == stat:
+            stat = TimedStat()
+            self.handlers[name] = stat
+        stat.add(elapsed)
+        self.pcCounts[pc] = self.pcCounts.get(pc, 0) + 1
+
+    # Called every emulated frame, i.e. on every timer tick
+    def endFrame(self):
+        now = time.perf_counter()
+        self.frames.add(now - self.frameStart)
+        self.frameStart = now
+
+    # Replaces the render (and, for the pygame Gpu, present) methods of gpu
+    # with ones that are timed
+    def attachGpu(self, gpu):
+        gpu.render = self.timed(gpu.render, self.renders)
+        if hasattr(gpu, "present"):
+            gpu.present = self.timed(gpu.present, self.presents)
+
+    def timed(self, func, stat):
+        def timedFunc(*args, **kwargs):
+            timeBefore = time.perf_counter()
+            retVal = func(*args, **kwargs)
+            stat.add(time.perf_counter() - timeBefore)
+            return retVal
+        return timedFunc
+
+    def toDict(self):
+        hotPcs = sorted(self.pcCounts.items(), key = lambda item: item[1], reverse = True)
+        instructionsPerSec = 0.0
+        if self.runTime > 0.0:
+            instructionsPerSec = self.numInstructions / self.runTime
+        return {
+            "instructions": self.numInstructions,
+            "runTime": self.runTime,
+            "instructionsPerSec": instructionsPerSec,
+            "families": dict((format(family, 'X') + "xxx", stat.toDict())
+                             for family, stat in enumerate(self.families) if stat.count > 0),
+            "handlers": dict((name, stat.toDict()) for name, stat in self.handlers.items()),
+            "hotPcs": [[hex(pc), count] for pc, count in hotPcs[:NUM_HOT_PCS]],
+            "frames": self.frames.toDict(),
+            "renders": self.renders.toDict(),
+            "presents": self.presents.toDict(),
+        }
+
+    def report(self):
+        profile = self.toDict()
+        lines = []
+        lines.append("Instructions: " + str(profile["instructions"]) +
+                     " in " + "%.3f" % profile["runTime"] + " s (" +
+                     "%.0f" % profile["instructionsPerSec"] + " instructions/s)")
+        lines.append("")
+        lines.append("%-24s %10s %12s %10s" % ("Handler", "Count", "Time (s)", "Mean (us)"))
+        handlers = sorted(profile["handlers"].items(), key = lambda item: item[1]["time"], reverse = True)
+        for name, stat in handlers:
+            lines.append("%-24s %10d %12.6f %10.3f" % (name, stat["count"], stat["time"], stat["meanTime"] * 1e6))
+        lines.append("")
+        lines.append("%-24s %10s %12s %10s" % ("Family", "Count", "Time (s)", "Mean (us)"))
+        for name, stat in profile["families"].items():
+            lines.append("%-24s %10d %12.6f %10.3f" % (name, stat["count"], stat["time"], stat["meanTime"] * 1e6))
+        lines.append("")
+        lines.append("Hot PCs:")
+        for pc, count in profile["hotPcs"]:
+            lines.append("  " + pc + ": " + str(count))
+        lines.append("")
+        for name in ("frames", "renders", "presents"):
+            stat = profile[name]
+            lines.append("%-9s count %d, mean %.3f ms, min %.3f ms, max %.3f ms" %
+                         (name.capitalize() + ":", stat["count"], stat["meanTime"] * 1e3,
+                          stat["minTime"] * 1e3, stat["maxTime"] * 1e3))
+        return "\n".join(lines)
+
+    def write(self, path):
+        with open(path, 'w') as file:
+            if path.endswith(".json"):
+                json.dump(self.toDict(), file, indent = 2)
+            else:
+                file.write(self.report() + "\n")
@@ -1,14 +1,27 @@
 #!/usr/bin/env python3
 import struct
+import os
+import hashlib
+
+# ROM contents keyed by their hash, and the hash of every loaded path keyed
+# by the path along with the size and modification time it had when loaded
+romCache = {}
+pathCache = {}
 
 class Rom(object):
     def __init__(self):
-        self.romData = []
+        self.romData = b""
+        self.hash = None
 
     def load(self, path):
-        file = open(path, 'rb')
-        while True:
-            byte = file.read(1)
-            if not byte:
-                break
-            self.romData.append(ord(byte))
+        stat = os.stat(path)
+        pathKey = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        romHash = pathCache.get(pathKey)
+        if None == romHash or romHash not in romCache:
+            with open(path, 'rb') as file:
+                romData = file.read()
+            romHash = hashlib.sha256(romData).hexdigest()
+            romCache[romHash] = romData
+            pathCache[pathKey] = romHash
+        self.romData = romCache[romHash]
+        self.hash = romHash
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+import asyncio
+from cpu import FRAME_TIME
+from cpu import MAX_FRAMES_BEHIND
+
+TURBO_SLICE_CYCLES       = 2000
+
+# Runs a CPU on the current asyncio event loop until it is stopped, so that
+# any number of CPUs can share one thread. Every frame the CPU runs one timer
+# period worth of cycles, then onFrame(cpu) is called to poll input and
+# present, and the coroutine sleeps until the next frame deadline, paced
+# like Cpu.pace.
+#
+# The CPU should be unthrottled, pacing is done here. When throttled is
+# False the CPU runs flat out, in slices, for the whole frame instead.
+async def runSession(cpu, throttled = True, onFrame = None):
+    loop = asyncio.get_running_loop()
+    frameTime = FRAME_TIME
+    startTime = loop.time()
+    numFrames = 0
+
+    # Cpu.runFor marks the CPU as running, so stop requests are checked for
+    # between slices
+    cpu.running = True
+    while cpu.running:
+        if throttled:
+            cpu.runFor(cpu.timerPeriod)
+        else:
+            frameEnd = loop.time() + frameTime
+            while cpu.running and loop.time() < frameEnd:
+                cpu.runFor(TURBO_SLICE_CYCLES)
+
+        if None != onFrame:
+            onFrame(cpu)
+
+        numFrames += 1
+        now = loop.time()
+        deadline = startTime + numFrames * frameTime
+        if now - deadline > MAX_FRAMES_BEHIND * frameTime:
+            startTime = now
+            numFrames = 0
+            deadline = now
+        await asyncio.sleep(max(deadline - now, 0.0))
+
+# Runs several CPUs side by side on one event loop
+async def runSessions(cpus, throttled = True, onFrame = None):
+    await asyncio.gather(*[runSession(cpu, throttled, onFrame) for cpu in cpus])
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+import sys
+import struct
+import asyncio
+from rom import Rom
+from cpu import Cpu
+from cpu import VRAM_SIZE
+from keypad import RemoteKeypad
+from keypad import NUM_KEYS
+from display import SCREEN_X_SIZE
+from display import SCREEN_Y_SIZE
+from scheduler import runSession
+
+# Every message is a header holding the message type and the payload size,
+# followed by the payload
+MSG_HEADER               = struct.Struct("<BH")
+MSG_JOIN                 = 0x0 # Client: session number
+MSG_HELLO                = 0x1 # Server: session number, width, height
+MSG_FRAME                = 0x2 # Server: frame number, changed rows, deltas
+MSG_KEY                  = 0x3 # Client: key, 1 if down or 0 if up
+
+JOIN_PAYLOAD             = struct.Struct("<H")
+HELLO_PAYLOAD            = struct.Struct("<HHH")
+FRAME_HEADER             = struct.Struct("<II")
+KEY_PAYLOAD              = struct.Struct("<BB")
+
+ROW_BYTES                = SCREEN_X_SIZE // 8
+# Viewers that have this much unsent data skip frames until they catch up
+MAX_PENDING_BYTES        = 64 * 1024
+DEFAULT_ADDRESS          = "127.0.0.1:8008"
+
+def message(msgType, payload):
+    return MSG_HEADER.pack(msgType, len(payload)) + payload
+
+async def readMessage(reader):
+    msgType, size = MSG_HEADER.unpack(await reader.readexactly(MSG_HEADER.size))
+    return msgType, await reader.readexactly(size)
+
+# Run-length encodes bytes as (count, value) pairs
+def encodeRuns(data):
+    runs = bytearray()
+    index = 0
+    while index < len(data):
+        value = data[index]
+        count = 1
+        while index + count < len(data) and data[index + count] == value:
+            count += 1
+        runs.append(count)
+        runs.append(value)
+        index += count
+    return bytes(runs)
+
+# A frame delta is a mask of the rows that changed since the last frame
+# the viewer got, followed by every changed row XORed with its old value and
+# run-length encoded, top to bottom. Returns None if nothing changed.
+def encodeDelta(frameNumber, oldRows, newRows):
+    rowMask = 0
+    runs = b""
+    for y in range(VRAM_SIZE):
+        diff = oldRows[y] ^ newRows[y]
+        if diff:
+            rowMask |= 1 << y
+            runs += encodeRuns(diff.to_bytes(ROW_BYTES, 'big'))
+    if 0 == rowMask:
+        return None
+    return FRAME_HEADER.pack(frameNumber, rowMask) + runs
+
+# Applies a frame delta to a list of packed rows, returns the frame number
+def applyDelta(rows, payload):
+    frameNumber, rowMask = FRAME_HEADER.unpack_from(payload)
+    offset = FRAME_HEADER.size
+    for y in range(VRAM_SIZE):
+        if rowMask & (1 << y):
+            diff = bytearray()
+            while len(diff) < ROW_BYTES:
+                count, value = payload[offset], payload[offset + 1]
+                diff.extend([value] * count)
+                offset += 2
+            rows[y] ^= int.from_bytes(diff, 'big')
+    return frameNumber
+
+class Viewer(object):
+    def __init__(self, writer):
+        self.writer = writer
+        # Clients start out with a blank screen
+        self.rows = [0x0] * VRAM_SIZE
+
+    def sendFrame(self, frameNumber, vram):
+        if self.writer.transport.get_write_buffer_size() > MAX_PENDING_BYTES:
+            # The next delta sent covers everything skipped
+            return
+        payload = encodeDelta(frameNumber, self.rows, vram)
+        if None != payload:
+            self.writer.write(message(MSG_FRAME, payload))
+            self.rows = list(vram)
+
+# A headless CPU with the viewers watching it. Any viewer can send input.
+class Session(object):
+    def __init__(self, romData, jit):
+        self.keypad = RemoteKeypad()
+        self.cpu = Cpu(None, self.keypad, jit, False)
+        self.cpu.load(romData)
+        self.viewers = []
+        self.numFrames = 0
+
+    def onFrame(self, cpu):
+        self.numFrames += 1
+        for viewer in self.viewers:
+            viewer.sendFrame(self.numFrames, cpu.vram)
+
+# Hosts any number of sessions on one event loop. Clients connect, send
+# MSG_JOIN with a session number and are answered with MSG_HELLO, after
+# which they are streamed frame deltas and may send MSG_KEY.
+class Server(object):
+    def __init__(self, sessions, throttled = True):
+        self.sessions = sessions
+        self.throttled = throttled
+
+    async def handleClient(self, reader, writer):
+        viewer = Viewer(writer)
+        session = None
+        try:
+            # Any malformed message ends the connection
+            msgType, payload = await readMessage(reader)
+            if MSG_JOIN != msgType or JOIN_PAYLOAD.size != len(payload):
+                return
+            sessionNumber, = JOIN_PAYLOAD.unpack(payload)
+            if sessionNumber >= len(self.sessions):
+                return
+            session = self.sessions[sessionNumber]
+            writer.write(message(MSG_HELLO, HELLO_PAYLOAD.pack(sessionNumber, SCREEN_X_SIZE, SCREEN_Y_SIZE)))
+            session.viewers.append(viewer)
+
+            while True:
+                msgType, payload = await readMessage(reader)
+                if MSG_KEY == msgType:
+                    if KEY_PAYLOAD.size != len(payload):
+                        return
+                    key, down = KEY_PAYLOAD.unpack(payload)
+                    if key < NUM_KEYS:
+                        if down:
+                            session.keypad.keyDown(key)
+                        else:
+                            session.keypad.keyUp(key)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if None != session and viewer in session.viewers:
+                session.viewers.remove(viewer)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    # Listens on host:port, or on a Unix socket if the address is a path
+    async def serve(self, address):
+        if '/' in address:
+            server = await asyncio.start_unix_server(self.handleClient, address)
+        else:
+            host, port = address.rsplit(':', 1)
+            server = await asyncio.start_server(self.handleClient, host, int(port))
+        async with server:
+            await asyncio.gather(server.serve_forever(),
+                                 *[runSession(session.cpu, self.throttled, session.onFrame)
+                                   for session in self.sessions])
+
+def argList(flag):
+    values = []
+    if flag in sys.argv:
+        index = sys.argv.index(flag) + 1
+        while index < len(sys.argv) and not sys.argv[index].startswith('-'):
+            values.append(sys.argv[index])
+            index += 1
+    return values
+
+if "__main__" == __name__:
+    romPaths = argList('-r')
+    numCopies = 1
+    address = DEFAULT_ADDRESS
+    jit = False
+    throttled = True
+    if '-n' in sys.argv:
+        index = sys.argv.index('-n')
+        numCopies = int(sys.argv[index + 1])
+    if '-l' in sys.argv:
+        index = sys.argv.index('-l')
+        address = sys.argv[index + 1]
+    if '-j' in sys.argv:
+        jit = True
+    if '-t' in sys.argv:
+        throttled = False
+
+    if 0 == len(romPaths):
+        print("Provide rom paths with -r, optionally copies of each with -n and a host:port or socket path with -l Eg. python3 server.py -r a.ch8 b.ch8 -n 4 -l 127.0.0.1:8008")
+        raise SystemExit
+
+    sessions = []
+    for romPath in romPaths:
+        rom = Rom()
+        rom.load(romPath)
+        for copy in range(numCopies):
+            sessions.append(Session(rom.romData, jit))
+    for index in range(len(sessions)):
+        print("Session " + str(index) + ": " + romPaths[index // numCopies])
+    try:
+        asyncio.run(Server(sessions, throttled).serve(address))
+    except KeyboardInterrupt:
+        pass
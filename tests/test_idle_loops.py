@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu import Cpu
+from cpu import InstructionSet
+from cpu import PRG_START_ADDR
+
+def assemble(opcodes):
+    return bytes([byte for opcode in opcodes for byte in (opcode >> 8, opcode & 0xFF)])
+
+# Runs a ROM headless, with or without idle loops being fast forwarded
+def run(romData, numCycles, fastForward):
+    cpu = Cpu(None, None, False, False)
+    cpu.load(romData)
+    if fastForward:
+        cpu.runFor(numCycles)
+    else:
+        with mock.patch.object(InstructionSet, "idleLoop", lambda self, ram, start, end: None):
+            cpu.runFor(numCycles)
+    return (bytes(cpu.V), cpu.I, cpu.pc, cpu.D, cpu.S, cpu.cycles)
+
+# Small loops waiting on the delay timer, made of the instructions idle loops
+# may consist of, closed by a backward jump and followed by a halt
+def timerLoop(rng):
+    opcodes = [0x6000 | rng.randrange(3) << 8 | rng.randrange(40),
+               0xF015 | rng.randrange(3) << 8]
+    start = len(opcodes)
+    for index in range(rng.randrange(1, 7)):
+        x = rng.randrange(3)
+        kind = rng.random()
+        if kind < 0.3:
+            opcodes.append(0xF007 | x << 8)
+        elif kind < 0.5:
+            opcodes.append(0x3000 | x << 8 | rng.choice([0, 1, 2, rng.randrange(40)]))
+        elif kind < 0.7:
+            opcodes.append(0x4000 | x << 8 | rng.choice([0, 1, 2, rng.randrange(40)]))
+        else:
+            opcodes.append(0x6000 | x << 8 | rng.choice([0, 1, 2]))
+    opcodes.append(0x1000 | (PRG_START_ADDR + 2 * start))
+    opcodes.append(0x1000 | (PRG_START_ADDR + 2 * len(opcodes)))
+    return assemble(opcodes)
+
+class IdleLoopTest(unittest.TestCase):
+    def assertSameAsInterpreter(self, romData, numCycles):
+        self.assertEqual(run(romData, numCycles, False), run(romData, numCycles, True),
+                         romData.hex() + " for " + str(numCycles) + " cycles")
+
+    # The last iteration skipped the register load the following ones do
+    def testLoadSkippedInLastIteration(self):
+        self.assertSameAsInterpreter(assemble([0x4B01, 0x6F05, 0x1202]), 4)
+
+    # V0 is tested before it is reloaded from the timer
+    def testValueCarriedIntoNextIteration(self):
+        self.assertSameAsInterpreter(assemble([0x6016, 0xF015, 0x3016, 0x3101, 0xF007, 0x1204]), 200)
+
+    def testHaltLoop(self):
+        self.assertSameAsInterpreter(assemble([0x6030, 0xF015, 0x1204]), 1000)
+
+    def testRandomTimerLoops(self):
+        rng = random.Random(0)
+        for index in range(1000):
+            self.assertSameAsInterpreter(timerLoop(rng), rng.randrange(5, 400))
+
+if "__main__" == __name__:
+    unittest.main()
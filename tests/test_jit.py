@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu import Cpu
+from cpu import PRG_START_ADDR
+
+def assemble(opcodes):
+    return bytes([byte for opcode in opcodes for byte in (opcode >> 8, opcode & 0xFF)])
+
+# Runs a ROM headless in slices of numCycles, so that runs end both on
+# block boundaries and in the middle of blocks. Code overwritten with data
+# may index past RAM or the keypad, a block then stops halfway through, so
+# only the error is compared.
+def run(romData, numSlices, sliceCycles, jit):
+    cpu = Cpu(None, None, jit, False)
+    cpu.rng.seed(0)
+    cpu.load(romData)
+    try:
+        for index in range(numSlices):
+            cpu.runFor(sliceCycles)
+    except IndexError:
+        return "IndexError"
+    return (bytes(cpu.V), cpu.I, cpu.pc, cpu.sp, bytes(cpu.stack), cpu.D, cpu.S,
+            cpu.cycles, cpu.interrupt, cpu.running, bytes(cpu.ram), bytes(cpu.vram))
+
+# Random code mixing block bodies with every kind of instruction ending a
+# block. I only ever points into the code itself or the font, so that FX33
+# and FX55 overwrite instructions that are likely already translated.
+def randomRom(rng):
+    size = rng.randrange(4, 40)
+    opcodes = []
+    for index in range(size):
+        x = rng.randrange(16)
+        y = rng.randrange(16)
+        nn = rng.randrange(256)
+        addr = PRG_START_ADDR + 2 * rng.randrange(size)
+        kind = rng.random()
+        if kind < 0.15:
+            opcodes.append(0x6000 | x << 8 | nn)
+        elif kind < 0.27:
+            opcodes.append(0x7000 | x << 8 | nn)
+        elif kind < 0.37:
+            opcodes.append(0x8000 | x << 8 | y << 4 | rng.choice([0x0, 0x2, 0x4, 0x5, 0x6, 0xE]))
+        elif kind < 0.43:
+            opcodes.append(0x3000 | x << 8 | rng.choice([0, 1, nn]))
+        elif kind < 0.49:
+            opcodes.append(0x4000 | x << 8 | rng.choice([0, 1, nn]))
+        elif kind < 0.54:
+            opcodes.append(0xA000 | (addr + rng.choice([0, 1])))
+        elif kind < 0.56:
+            opcodes.append(0xF029 | x << 8)
+        elif kind < 0.58:
+            opcodes.append(0xC000 | x << 8 | nn)
+        elif kind < 0.60:
+            opcodes.append(0xD000 | x << 8 | y << 4 | rng.randrange(16))
+        elif kind < 0.63:
+            opcodes.append(0xF007 | x << 8)
+        elif kind < 0.65:
+            opcodes.append(0xF015 | x << 8)
+        elif kind < 0.67:
+            opcodes.append(0xF033 | x << 8)
+        elif kind < 0.69:
+            opcodes.append(0xF055 | rng.randrange(4) << 8)
+        elif kind < 0.72:
+            opcodes.append(0xF065 | rng.randrange(4) << 8)
+        elif kind < 0.80:
+            opcodes.append(0x2000 | addr)
+        elif kind < 0.89:
+            opcodes.append(0x00EE)
+        else:
+            # Mostly short backward jumps, which may close idle loops
+            if rng.random() < 0.7:
+                addr = PRG_START_ADDR + 2 * max(0, index - rng.randrange(8))
+            opcodes.append(0x1000 | addr)
+    opcodes.append(0x1000 | PRG_START_ADDR)
+    return assemble(opcodes)
+
+class JitTest(unittest.TestCase):
+    def assertSameAsInterpreter(self, romData, numSlices, sliceCycles):
+        self.assertEqual(run(romData, numSlices, sliceCycles, False), run(romData, numSlices, sliceCycles, True),
+                         romData.hex() + " in slices of " + str(sliceCycles) + " cycles")
+
+    # A subroutine made of a body and a return, called from a loop
+    def testCallsAndReturns(self):
+        self.assertSameAsInterpreter(assemble([0x2206, 0x7001, 0x1200, 0x7101, 0x8014, 0x00EE]), 10, 1000)
+
+    # FX55 replaces the skip ending a translated block with a jump
+    def testStoreIntoCachedBlock(self):
+        romData = assemble([0x7201, 0x3205, 0x1200, 0x6012, 0x610C, 0xA202, 0xF155, 0x1200])
+        self.assertSameAsInterpreter(romData, 10, 1000)
+
+    # FX33 overwrites the body of a translated block, which then runs into
+    # an illegal instruction
+    def testBcdIntoCachedBlock(self):
+        romData = assemble([0x7001, 0x7101, 0x3003, 0x1200, 0xA202, 0xF033, 0x1200])
+        self.assertSameAsInterpreter(romData, 10, 1000)
+
+    def testRandomRoms(self):
+        rng = random.Random(0)
+        for index in range(1000):
+            self.assertSameAsInterpreter(randomRom(rng), 10, rng.choice([1, 7, 100, 300]))
+
+if "__main__" == __name__:
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu import Cpu
+from keypad import ScriptedKeypad
+
+def assemble(opcodes):
+    return bytes([byte for opcode in opcodes for byte in (opcode >> 8, opcode & 0xFF)])
+
+def makeCpu(romData, events):
+    cpu = Cpu(None, ScriptedKeypad(events), False, False)
+    cpu.load(romData)
+    return cpu
+
+def state(cpu):
+    return (bytes(cpu.V), cpu.I, cpu.pc, cpu.sp, cpu.D, cpu.S, cpu.cycles, cpu.interrupt)
+
+class RequestTest(unittest.TestCase):
+    # Runs the ROM, posts a snapshot request after postCycle cycles, and
+    # checks that a CPU restored from it continues exactly like the original
+    def assertSnapshotResumes(self, romData, events, postCycle, numCycles):
+        cpu = makeCpu(romData, events)
+        cpu.runFor(postCycle)
+        snapshots = []
+        cpu.post(lambda cpu: snapshots.append(cpu.snapshot()))
+        cpu.runFor(numCycles)
+        self.assertEqual(1, len(snapshots))
+
+        restored = makeCpu(romData, events)
+        restored.restore(snapshots[0])
+        restored.runFor(cpu.cycles - restored.cycles)
+        self.assertEqual(state(cpu), state(restored))
+
+    # FX0A skips ahead to the key press
+    def testSnapshotWhileWaitingForKey(self):
+        romData = assemble([0x7001, 0xF20A, 0x7101, 0x1206])
+        self.assertSnapshotResumes(romData, [(1000, 5, True)], 20, 2000)
+
+    # The idle loop is fast forwarded up to the key press
+    def testSnapshotInIdleLoop(self):
+        romData = assemble([0x6030, 0xF015, 0x7101, 0xE19E, 0x1206, 0x7201, 0x120C])
+        self.assertSnapshotResumes(romData, [(1000, 0, True)], 20, 2000)
+
+    # Restoring into a CPU that was waiting for a key starts the wait over,
+    # so a key pressed before the restored state's wait began is not taken
+    def testRestoreIntoWaitingCpu(self):
+        romData = assemble([0x6000, 0xF00A, 0x7001, 0x1206])
+        cpu = makeCpu(romData, [(1000, 5, True)])
+        cpu.runFor(20)
+        self.assertTrue(cpu.waitingForKey)
+
+        later = makeCpu(romData, [])
+        later.restore(cpu.snapshot())
+        later.cycles = 1500
+        cpu.restore(later.snapshot())
+        cpu.runFor(100)
+        self.assertEqual(0x202, cpu.pc)
+        self.assertEqual(0, cpu.V[0])
+
+if "__main__" == __name__:
+    unittest.main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import random
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu import VRAM_SIZE
+from server import MSG_JOIN
+from server import MSG_HELLO
+from server import MSG_FRAME
+from server import MSG_KEY
+from server import MSG_HEADER
+from server import JOIN_PAYLOAD
+from server import KEY_PAYLOAD
+from server import MAX_PENDING_BYTES
+from server import Server
+from server import Session
+from server import Viewer
+from server import message
+from server import encodeRuns
+from server import encodeDelta
+from server import applyDelta
+
+# Stands in for an asyncio.StreamWriter, keeping what is written
+class FakeTransport(object):
+    def __init__(self):
+        self.bufferSize = 0
+
+    def get_write_buffer_size(self):
+        return self.bufferSize
+
+class FakeWriter(object):
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    def close(self):
+        self.closed = True
+
+    async def wait_closed(self):
+        pass
+
+    # Splits what was written into (type, payload) messages
+    def messages(self):
+        messages = []
+        offset = 0
+        while offset < len(self.data):
+            msgType, size = MSG_HEADER.unpack_from(self.data, offset)
+            offset += MSG_HEADER.size
+            messages.append((msgType, self.data[offset:offset + size]))
+            offset += size
+        return messages
+
+def randomFrame(rng, oldRows):
+    rows = list(oldRows)
+    for index in range(rng.randrange(4)):
+        rows[rng.randrange(VRAM_SIZE)] = rng.getrandbits(64)
+    if rng.random() < 0.5:
+        rows[rng.randrange(VRAM_SIZE)] ^= 0xFF << (8 * rng.randrange(8))
+    return rows
+
+class DeltaTest(unittest.TestCase):
+    def testEncodeRuns(self):
+        self.assertEqual(b"", encodeRuns(b""))
+        self.assertEqual(bytes([3, 0, 1, 7, 4, 0]), encodeRuns(bytes([0, 0, 0, 7, 0, 0, 0, 0])))
+
+    def testUnchangedFrame(self):
+        rows = [0x1234] * VRAM_SIZE
+        self.assertEqual(None, encodeDelta(1, rows, list(rows)))
+
+    def testRoundTrip(self):
+        rng = random.Random(0)
+        serverRows = [0x0] * VRAM_SIZE
+        clientRows = [0x0] * VRAM_SIZE
+        for frameNumber in range(1, 1000):
+            newRows = randomFrame(rng, serverRows)
+            payload = encodeDelta(frameNumber, serverRows, newRows)
+            if None != payload:
+                self.assertEqual(frameNumber, applyDelta(clientRows, payload))
+            serverRows = newRows
+            self.assertEqual(serverRows, clientRows)
+
+    # A viewer too far behind skips frames, the next delta it is sent then
+    # covers everything it skipped
+    def testViewerCatchesUp(self):
+        rng = random.Random(1)
+        writer = FakeWriter()
+        viewer = Viewer(writer)
+        vram = [0x0] * VRAM_SIZE
+        for frameNumber in range(1, 200):
+            writer.transport.bufferSize = MAX_PENDING_BYTES + 1 if rng.random() < 0.5 else 0
+            vram = randomFrame(rng, vram)
+            viewer.sendFrame(frameNumber, vram)
+        writer.transport.bufferSize = 0
+        vram = randomFrame(rng, vram)
+        vram[0] ^= 0x1
+        viewer.sendFrame(200, vram)
+
+        clientRows = [0x0] * VRAM_SIZE
+        frameNumbers = []
+        for msgType, payload in writer.messages():
+            self.assertEqual(MSG_FRAME, msgType)
+            frameNumbers.append(applyDelta(clientRows, payload))
+        self.assertEqual(vram, clientRows)
+        self.assertEqual(200, frameNumbers[-1])
+        self.assertLess(len(frameNumbers), 200)
+
+class ConnectionTest(unittest.TestCase):
+    def setUp(self):
+        self.session = Session(bytes([0x12, 0x00]), False)
+        self.server = Server([self.session])
+
+    # Feeds the messages to a client connection. Returns the writer and
+    # whether the server ended the connection by itself.
+    def connect(self, messages):
+        async def run():
+            reader = asyncio.StreamReader()
+            writer = FakeWriter()
+            for msgType, payload in messages:
+                reader.feed_data(message(msgType, payload))
+            task = asyncio.ensure_future(self.server.handleClient(reader, writer))
+            try:
+                await asyncio.wait_for(asyncio.shield(task), 0.1)
+                return writer, True
+            except asyncio.TimeoutError:
+                reader.feed_eof()
+                await task
+                return writer, False
+        return asyncio.run(run())
+
+    def testJoinAndKey(self):
+        writer, ended = self.connect([(MSG_JOIN, JOIN_PAYLOAD.pack(0)), (MSG_KEY, KEY_PAYLOAD.pack(5, 1))])
+        self.assertFalse(ended)
+        self.assertEqual(MSG_HELLO, writer.messages()[0][0])
+        self.assertTrue(self.session.keypad.keyPressed(5))
+        self.assertTrue(writer.closed)
+        self.assertEqual([], self.session.viewers)
+
+    def testMalformedJoin(self):
+        for payload in (b"", b"\x00", b"\x00\x00\x00"):
+            writer, ended = self.connect([(MSG_JOIN, payload)])
+            self.assertTrue(ended)
+            self.assertEqual(b"", writer.data)
+            self.assertTrue(writer.closed)
+
+    def testUnknownSession(self):
+        writer, ended = self.connect([(MSG_JOIN, JOIN_PAYLOAD.pack(1))])
+        self.assertTrue(ended)
+        self.assertEqual(b"", writer.data)
+
+    def testMalformedKey(self):
+        for payload in (b"", b"\x05", b"\x05\x01\x00"):
+            writer, ended = self.connect([(MSG_JOIN, JOIN_PAYLOAD.pack(0)), (MSG_KEY, payload)])
+            self.assertTrue(ended)
+            self.assertTrue(writer.closed)
+            self.assertEqual([], self.session.viewers)
+            self.assertFalse(self.session.keypad.keyPressed(5))
+
+if "__main__" == __name__:
+    unittest.main()
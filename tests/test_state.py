@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cpu import Cpu
+from cpu import STATE_LAYOUT
+from cpu import STATE_VERSION
+
+def assemble(opcodes):
+    return bytes([byte for opcode in opcodes for byte in (opcode >> 8, opcode & 0xFF)])
+
+# Draws at random positions from a subroutine while the delay timer runs
+ROM_DATA = assemble([
+    0x6005, # 200: V0 = 5
+    0xF015, # 202: D = V0
+    0xC1FF, # 204: V1 = rand
+    0xA050, # 206: I = font
+    0xD115, # 208: draw V1, V1, 5
+    0x2210, # 20A: call 210
+    0x1204, # 20C: loop
+    0x0000,
+    0x7201, # 210: V2 += 1
+    0x00EE, # 212: ret
+])
+
+def makeCpu():
+    cpu = Cpu(None, None, False, False)
+    cpu.rng.seed(1)
+    return cpu
+
+def state(cpu):
+    return (bytes(cpu.ram), bytes(cpu.vram), bytes(cpu.V), cpu.I, cpu.pc, cpu.sp,
+            bytes(cpu.stack), cpu.D, cpu.S, cpu.delayCycle, cpu.cycles, cpu.interrupt)
+
+class StateTest(unittest.TestCase):
+    def setUp(self):
+        self.cpu = makeCpu()
+        self.cpu.load(ROM_DATA)
+        # Stop right after a draw, with its interrupt still pending and a
+        # gauss value cached by the RNG
+        while None == self.cpu.interrupt:
+            self.cpu.runFor(1)
+        self.cpu.rng.gauss(0.0, 1.0)
+
+    def testLayoutSize(self):
+        self.assertEqual(STATE_LAYOUT.size, len(self.cpu.snapshot()))
+
+    def testRoundTrip(self):
+        snapshot = self.cpu.snapshot()
+        restored = makeCpu()
+        restored.restore(snapshot)
+        self.assertEqual(snapshot, restored.snapshot())
+        self.assertEqual(state(self.cpu), state(restored))
+        self.assertNotEqual(None, restored.interrupt)
+
+    # The restored CPU runs on exactly like the original one, drawing at
+    # the same random positions
+    def testRunsIdenticallyAfterRestore(self):
+        restored = makeCpu()
+        restored.restore(self.cpu.snapshot())
+        self.cpu.runFor(5000)
+        restored.runFor(5000)
+        self.assertEqual(state(self.cpu), state(restored))
+        self.assertEqual(self.cpu.rng.gauss(0.0, 1.0), restored.rng.gauss(0.0, 1.0))
+        self.assertEqual(self.cpu.rng.random(), restored.rng.random())
+
+    def testRejectsOtherVersions(self):
+        snapshot = bytearray(self.cpu.snapshot())
+        snapshot[0] = STATE_VERSION + 1
+        restored = makeCpu()
+        with self.assertRaises(ValueError):
+            restored.restore(bytes(snapshot))
+
+if "__main__" == __name__:
+    unittest.main()